@@ -0,0 +1,156 @@
+# --------------------
+# Lasttest gegen den lokalen Spotify-Ersatz (benchmarks/spotify_stub.py)
+# Startet Stub und App in diesem Prozess, meldet mehrere Test-Konten an und lässt
+# N simulierte Tabs gleichzeitig Startseite, Polling, Auflösen und Steuerbefehle aufrufen.
+# Ausgabe: Durchsatz sowie p50/p99 je Aufrufart.
+# Aufruf: python benchmarks/bench_load.py
+# Mit REDIS_URL in der Umgebung laufen Caches, Token-Store und Gateway über Redis.
+# --------------------
+
+import contextlib
+import importlib.util
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.serving import make_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, '..', 'music-quiz.py')
+sys.path.insert(0, HERE)
+
+import spotify_stub
+
+# --- EINSTELLUNGEN ---
+tabs = 16                 # Gleichzeitige simulierte Tabs
+accounts = 4              # Spotify-Konten, auf die sich die Tabs verteilen
+duration_seconds = 20
+think_time_seconds = 0.05 # Pause eines Tabs zwischen zwei Aufrufen
+show_app_output = False   # print()-Ausgaben und Zugriffslog der App während des Laufs anzeigen
+stub_latency_ms = 30
+stub_rate_429 = 0.0
+scenario_weights = {      # Relativer Anteil der Aufrufarten
+    'check-song': 60,     # Polling
+    'home': 15,           # Seitenaufruf (inkl. /api/state)
+    'solve': 15,          # Auflösen: Jahressuche und Cover-Analyse
+    'control': 10,        # /next, /previous, /play_pause, /play_random
+}
+# --- ENDE DER EINSTELLUNGEN ---
+
+def start_app(stub_url):
+    """Lädt die App mit Umleitung auf den Stub und startet sie auf einem freien Port."""
+    os.environ.update({
+        'SPOTIFY_API_URL': f"{stub_url}/v1/",
+        'SPOTIFY_ACCOUNTS_URL': stub_url,
+        'CLIENT_ID': 'stub-client',
+        'CLIENT_SECRET': 'stub-secret',
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'bench-secret'),
+    })
+    spec = importlib.util.spec_from_file_location('music_quiz', APP_PATH)
+    music_quiz = importlib.util.module_from_spec(spec)
+    sys.modules['music_quiz'] = music_quiz  # Flask findet templates/ und static/ über das Modul
+    spec.loader.exec_module(music_quiz)
+    # Genug Keep-Alive-Verbindungen zum Stub, wie sie für api.spotify.com konfiguriert sind
+    music_quiz.http_session.mount(stub_url, HTTPAdapter(pool_connections=1, pool_maxsize=tabs * 2))
+
+    server = make_server('127.0.0.1', 0, music_quiz.app, threaded=True)
+    app_url = f"http://127.0.0.1:{server.server_port}"
+    os.environ['REDIRECT_URI'] = f"{app_url}/callback"
+    threading.Thread(target=server.serve_forever, name="music-quiz-app", daemon=True).start()
+    return server, app_url
+
+def login(app_url):
+    """Durchläuft /login -> Stub-Authorize -> /callback und gibt die angemeldete Session zurück."""
+    http = requests.Session()
+    response = http.get(f"{app_url}/login", timeout=30)
+    response.raise_for_status()
+    return http
+
+def run_tab(app_url, cookies, deadline, results, seed):
+    rng = random.Random(seed)
+    http = requests.Session()
+    http.cookies.update(cookies)
+    json_headers = {'Accept': 'application/json'}
+    names, weights = zip(*scenario_weights.items())
+    etag = None  # Wie quiz.js: /check-song mit If-None-Match, 304 zählt als Erfolg
+    while time.time() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            if scenario == 'check-song':
+                response = http.get(f"{app_url}/check-song", headers={'If-None-Match': etag} if etag else {}, timeout=30)
+                etag = response.headers.get('ETag', etag)
+            elif scenario == 'home':
+                response = http.get(f"{app_url}/", timeout=30)
+            elif scenario == 'solve':
+                response = http.get(f"{app_url}/solve", headers=json_headers, timeout=30)
+            else:
+                route = rng.choice(['/next', '/previous', '/play_pause', '/play_random'])
+                response = http.get(f"{app_url}{route}", headers=json_headers, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        results.append((scenario, time.perf_counter() - start, ok))
+        time.sleep(think_time_seconds)
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    index = max(0, math.ceil(p * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def report(results, elapsed, stub_state, gateway_stats):
+    print(f"\n{len(results)} Anfragen in {elapsed:.1f}s  ->  {len(results) / elapsed:.1f} Anfragen/s\n")
+    print(f"{'Aufrufart':<12} {'Anzahl':>7} {'Fehler':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for scenario in scenario_weights:
+        latencies = sorted(duration for name, duration, _ in results if name == scenario)
+        errors = sum(1 for name, _, ok in results if name == scenario and not ok)
+        print(f"{scenario:<12} {len(latencies):>7} {errors:>7} {len(latencies) / elapsed:>7.1f} "
+              f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f}")
+    print("\nAufrufe beim Spotify-Stub:")
+    for endpoint, count in sorted(stub_state.calls.items(), key=lambda item: -item[1]):
+        print(f"  {endpoint:<36} {count:>7}")
+    if stub_state.injected_429:
+        print(f"  {'davon mit 429 beantwortet':<36} {stub_state.injected_429:>7}")
+    if stub_state.unknown:
+        print(f"  {'davon unbekannt (404)':<36} {stub_state.unknown:>7}")
+    # Abgelehnte Aufrufe sind keine HTTP-Fehler: die App antwortet dann z.B. ohne Originalversion
+    print("\nSpotify-Gateway je Priorität:")
+    print(f"  {'Priorität':<12} {'Aufrufe':>8} {'verzögert':>10} {'abgelehnt':>10} {'429':>6}")
+    for priority, counters in gateway_stats.items():
+        print(f"  {priority:<12} {counters.get('calls', 0):>8} {counters.get('delayed', 0):>10} "
+              f"{counters.get('rejected', 0):>10} {counters.get('throttled', 0):>6}")
+
+if __name__ == "__main__":
+    spotify_stub.latency_ms = stub_latency_ms
+    spotify_stub.rate_429 = stub_rate_429
+    stub_server, stub_state, stub_url = spotify_stub.start_stub()
+    app_server, app_url = start_app(stub_url)
+    print(f"Stub: {stub_url}  App: {app_url}  Tabs: {tabs}  Konten: {accounts}  Dauer: {duration_seconds}s")
+
+    if not show_app_output:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if show_app_output else devnull):
+        sessions = [login(app_url) for _ in range(accounts)]
+        results = []  # (Aufrufart, Sekunden, ok); list.append ist threadsicher
+        deadline = time.time() + duration_seconds
+        workers = [
+            threading.Thread(target=run_tab, args=(app_url, sessions[i % accounts].cookies, deadline, results, i))
+            for i in range(tabs)
+        ]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+    report(results, elapsed, stub_state, sys.modules['music_quiz'].spotify_gateway.stats())
+
+    app_server.shutdown()
+    stub_server.shutdown()
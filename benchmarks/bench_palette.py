@@ -0,0 +1,152 @@
+# --------------------
+# Mikro-Benchmark: Farbanalyse der Album-Cover
+# Vergleicht die alte Python-Schleife (colorsys pro Palettenfarbe) mit der NumPy-Auswertung
+# (inkl. Draft-Dekodierung), einzeln pro Cover und im Batch.
+# Die Cover werden lokal erzeugt, es gibt keine Netzwerkzugriffe.
+# Aufruf: python benchmarks/bench_palette.py
+# --------------------
+
+import colorsys
+import importlib.util
+import os
+import random
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, '..', 'music-quiz.py')
+
+spec = importlib.util.spec_from_file_location('music_quiz', APP_PATH)
+music_quiz = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(music_quiz)
+
+# --- EINSTELLUNGEN ---
+covers = 200         # Anzahl simulierter Cover
+cover_size = 640     # Kantenlänge, wie das größte Spotify-Cover
+repeats = 3
+# --- ENDE DER EINSTELLUNGEN ---
+
+def legacy_highlight(image_bytes):
+    """Die bisherige Auswertung aus analyze_album_art(), ohne Download."""
+    MIN_SATURATION = 0.25
+    MIN_VALUE = 0.5
+    with Image.open(BytesIO(image_bytes)) as img:
+        img.thumbnail((64, 64))
+        paletted_img = img.convert("RGB").quantize(colors=64)
+        palette = paletted_img.getpalette()
+        raw_colors_rgb = [tuple(palette[i:i+3]) for i in range(0, len(palette), 3)]
+
+    candidate_colors = []
+    for r, g, b in raw_colors_rgb:
+        h, s, v = colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
+        if s >= MIN_SATURATION and v >= MIN_VALUE:
+            candidate_colors.append({'rgb': (r, g, b), 'score': s * v})
+
+    if candidate_colors:
+        r, g, b = sorted(candidate_colors, key=lambda x: x['score'], reverse=True)[0]['rgb']
+        return f"#{r:02x}{g:02x}{b:02x}"
+    if raw_colors_rgb:
+        r, g, b = max(raw_colors_rgb, key=lambda c: (0.299*c[0] + 0.587*c[1] + 0.114*c[2]))
+        return f"#{r:02x}{g:02x}{b:02x}"
+    return None
+
+def build_covers(seed=42):
+    """Zufällige Cover aus Rechtecken und Kreisen; jedes fünfte in Graustufen (Fallback-Pfad)."""
+    rng = random.Random(seed)
+    result = []
+    for n in range(covers):
+        img = Image.new("RGB", (cover_size, cover_size), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rng.randrange(cover_size), rng.randrange(cover_size)
+            w, h = rng.randrange(40, 320), rng.randrange(40, 320)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            if rng.random() < 0.5:
+                draw.rectangle((x, y, x + w, y + h), fill=color)
+            else:
+                draw.ellipse((x, y, x + w, y + h), fill=color)
+        if n % 5 == 0:
+            img = img.convert("L").convert("RGB")
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        result.append(buffer.getvalue())
+    return result
+
+def vectorized_single(image_bytes):
+    return music_quiz.pick_highlight_colors([music_quiz.extract_cover_palette(image_bytes)])[0]
+
+def vectorized_batch(all_bytes):
+    return music_quiz.pick_highlight_colors([music_quiz.extract_cover_palette(b) for b in all_bytes])
+
+def run(label, func, data):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<28} {best * 1000:8.1f} ms gesamt  {best / len(data) * 1e6:8.1f} µs pro Cover")
+    return best
+
+def run_scoring(label, func, palettes):
+    best = None
+    for _ in range(repeats * 10):
+        start = time.perf_counter()
+        func(palettes)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<28} {best * 1000:8.2f} ms gesamt  {best / len(palettes) * 1e6:8.1f} µs pro Cover")
+    return best
+
+def legacy_scoring(palettes):
+    """Nur die Bewertungsschleife der alten Version, auf bereits quantisierten Paletten."""
+    results = []
+    for raw_colors_rgb in palettes:
+        candidates = []
+        for r, g, b in raw_colors_rgb:
+            h, s, v = colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
+            if s >= 0.25 and v >= 0.5:
+                candidates.append({'rgb': (r, g, b), 'score': s * v})
+        if candidates:
+            results.append(sorted(candidates, key=lambda x: x['score'], reverse=True)[0]['rgb'])
+        else:
+            results.append(max(raw_colors_rgb, key=lambda c: (0.299*c[0] + 0.587*c[1] + 0.114*c[2])))
+    return results
+
+if __name__ == "__main__":
+    cover_bytes = build_covers()
+
+    # Die Bewertung muss auf denselben Paletten exakt der bisherigen Heuristik entsprechen
+    palettes = [music_quiz.extract_cover_palette(b) for b in cover_bytes]
+    palette_tuples = [[tuple(int(c) for c in row) for row in p] for p in palettes]
+    expected = ["#%02x%02x%02x" % rgb for rgb in legacy_scoring(palette_tuples)]
+    if expected != music_quiz.pick_highlight_colors(palettes):
+        raise SystemExit("Abweichende Bewertung der Paletten")
+    if vectorized_batch(cover_bytes) != [vectorized_single(b) for b in cover_bytes]:
+        raise SystemExit("Batch und Einzelauswertung weichen voneinander ab")
+
+    # Der Draft-Modus dekodiert JPEGs verkleinert, die Farben verschieben sich dadurch leicht
+    legacy_colors = [legacy_highlight(b) for b in cover_bytes]
+    distances = [
+        max(abs(int(a[i:i+2], 16) - int(b[i:i+2], 16)) for i in (1, 3, 5))
+        for a, b in zip(legacy_colors, expected)
+    ]
+    close = sum(1 for d in distances if d <= 16)
+    print(f"{len(cover_bytes)} Cover geprüft, Bewertung identisch. Gegenüber der alten Dekodierung: "
+          f"{close} Akzentfarben weichen höchstens 16 je Kanal ab, "
+          f"{len(cover_bytes) - close} kippen zu einer anderen Farbe des Covers.\n")
+
+    print("Komplette Analyse (Dekodieren, Verkleinern, Quantisieren, Bewerten):")
+    legacy = run("Alte Schleife (colorsys)", lambda data: [legacy_highlight(b) for b in data], cover_bytes)
+    vec_single = run("NumPy, einzeln", lambda data: [vectorized_single(b) for b in data], cover_bytes)
+    vec_batch = run("NumPy, Batch", vectorized_batch, cover_bytes)
+
+    print("\nNur die Bewertung der quantisierten Paletten:")
+    legacy_score = run_scoring("Alte Schleife (colorsys)", legacy_scoring, palette_tuples)
+    vec_score = run_scoring("NumPy, Batch", music_quiz.pick_highlight_colors, palettes)
+
+    print(f"\nBeschleunigung gesamt, einzeln: {legacy / vec_single:5.2f}x")
+    print(f"Beschleunigung gesamt, Batch:   {legacy / vec_batch:5.2f}x")
+    print(f"Beschleunigung der Bewertung:   {legacy_score / vec_score:5.1f}x")
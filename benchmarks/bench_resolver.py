@@ -0,0 +1,84 @@
+# --------------------
+# Benchmark und Prüfung: Originalversion-Suche über ISRC und Titel
+# Löst alle Tracks des Spotify-Stubs auf und prüft, dass ein ISRC nur dann zählt, wenn er
+# eine ältere Version findet. Dazu der Remaster-Fall: ein eigener ISRC, der nur sich selbst findet.
+# Aufruf: python benchmarks/bench_resolver.py
+# --------------------
+
+import importlib.util
+import os
+import sys
+import time
+
+import spotipy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, '..', 'music-quiz.py')
+sys.path.insert(0, HERE)
+
+import spotify_stub
+
+spec = importlib.util.spec_from_file_location('music_quiz', APP_PATH)
+music_quiz = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(music_quiz)
+
+# --- EINSTELLUNGEN ---
+stub_latency_ms = 0         # Gemessen wird die Auflösung, nicht die Netzlatenz
+# --- ENDE DER EINSTELLUNGEN ---
+
+class RemasterSpotify:
+    """Spotify-Ersatz für den Remaster-Fall: der ISRC findet nur den Remaster von 2011."""
+    REMASTER = {'id': 'remaster', 'name': 'Song - 2011 Remaster', 'artists': [{'name': 'Band'}],
+                'external_ids': {'isrc': 'GBREM1100001'},
+                'album': {'name': 'Best Of', 'release_date': '2011-03-01'}}
+    ORIGINAL = {'id': 'original', 'name': 'Song', 'artists': [{'name': 'Band'}],
+                'external_ids': {'isrc': 'GBORG7500001'},
+                'album': {'name': 'First', 'release_date': '1975-06-01'}}
+
+    def search(self, q, type, limit, **kwargs):
+        if q.startswith("isrc:"):
+            items = [self.REMASTER] if q == "isrc:" + self.REMASTER['external_ids']['isrc'] else []
+        else:
+            items = [self.REMASTER, self.ORIGINAL]
+        return {'tracks': {'items': items}}
+
+def check_remaster():
+    track = RemasterSpotify.REMASTER
+    _, earliest = music_quiz.find_earliest_release(RemasterSpotify(), track)
+    year, album = music_quiz.original_release(track, earliest)
+    assert earliest and earliest['strategy'] == 'title', earliest
+    assert (year, album) == (1975, 'First'), (year, album)
+    print(f"Remaster mit eigenem ISRC: {track['name']!r} -> {year} ({album}), Strategie {earliest['strategy']}")
+
+def check_catalog(state, sp):
+    """Jeder dritte Stub-Track hat über den ISRC ein älteres Album, die übrigen nur sich selbst."""
+    start = time.perf_counter()
+    for n, track in enumerate(state.tracks):
+        album_year = int(track['album']['release_date'][:4])
+        _, earliest = music_quiz.find_earliest_release(sp, track)
+        if n % 3 == 0:
+            assert earliest['strategy'] == 'isrc' and earliest['year'] < album_year, (n, earliest)
+        else:
+            assert earliest is None or earliest['strategy'] == 'title', (n, earliest)
+    elapsed = time.perf_counter() - start
+    print(f"{len(state.tracks)} Stub-Tracks in {elapsed * 1000:.0f} ms "
+          f"({elapsed / len(state.tracks) * 1000:.2f} ms pro Track, ohne Cache)")
+
+if __name__ == "__main__":
+    check_remaster()
+    music_quiz.resolver_stats = music_quiz.ResolverStats(['isrc', 'title'])
+
+    spotify_stub.latency_ms = stub_latency_ms
+    spotify_stub.latency_jitter_ms = 0
+    stub_server, stub_state, stub_url = spotify_stub.start_stub()
+    # Direkt am Stub, ohne Gateway: dessen Drosselung würde die Messung bestimmen
+    sp = spotipy.Spotify(auth=stub_state.issue_token('bench-resolver')['access_token'])
+    sp.prefix = f"{stub_url}/v1/"
+    check_catalog(stub_state, sp)
+
+    print("\nAusgang je Strategie:")
+    print(f"  {'Strategie':<10} {'Anfragen':>9} {'älter':>7} {'nicht älter':>12} {'leer':>6} {'Trefferquote':>13}")
+    for name, stats in music_quiz.resolver_stats.stats().items():
+        print(f"  {name:<10} {stats['lookups']:>9} {stats['earlier']:>7} {stats['not_earlier']:>12} "
+              f"{stats['empty']:>6} {stats['hit_ratio']:>13}")
+    stub_server.shutdown()
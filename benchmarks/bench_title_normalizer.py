@@ -0,0 +1,84 @@
+# --------------------
+# Mikro-Benchmark: Titel-Bereinigung für die Originalversion-Suche
+# Vergleicht die alte Schleife (re.sub pro Muster und Titel) mit clean_track_name()
+# Aufruf: python benchmarks/bench_title_normalizer.py
+# --------------------
+
+import importlib.util
+import os
+import random
+import re
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, '..', 'music-quiz.py')
+
+spec = importlib.util.spec_from_file_location('music_quiz', APP_PATH)
+music_quiz = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(music_quiz)
+
+# --- EINSTELLUNGEN ---
+pages = 200          # Simulierte Lösungen (je eine Suchseite)
+page_size = 50       # Ergebnisse pro Suche, wie in search_earliest_release()
+repeats = 5
+# --- ENDE DER EINSTELLUNGEN ---
+
+BASE_TITLES = [
+    "Bohemian Rhapsody", "Hotel California", "Wonderwall", "Billie Jean", "Hey Jude",
+    "Smells Like Teen Spirit", "Like a Rolling Stone", "Imagine", "Purple Rain", "Dancing Queen",
+    "Superstition", "Africa", "Take On Me", "Sweet Child O' Mine", "Let It Be",
+]
+SUFFIXES = [
+    "", "", "", " - 2011 Remaster", " - Remastered 2009", " - 2015 Remastered Version",
+    " (Remastered)", " [Remastered]", " (Remaster)", " - Live", " - Live at Wembley 1986",
+    " (Live)", " [Live]", " - Edit", " (Edit)", " - Single Version", " (Single Version)",
+    " - Mono", " (Mono Version)", " - Stereo Mix", " (Stereo Version)", " - Original Mix",
+    " (Original Version)", " (Original)", " - Radio Edit", " (Radio Version)", " (Radio)",
+    " (Remastered)- Live", " - Acoustic", " (feat. Someone)",
+]
+
+def legacy_clean(track_name):
+    """Die bisherige Schleife aus home(), unverändert."""
+    for pattern in music_quiz.TERMS_TO_REMOVE:
+        track_name = re.sub(pattern, "", track_name, flags=re.IGNORECASE).strip()
+    return track_name
+
+def build_pages(seed=42):
+    rng = random.Random(seed)
+    return [[rng.choice(BASE_TITLES) + rng.choice(SUFFIXES) for _ in range(page_size)] for _ in range(pages)]
+
+def run(label, clean_page, search_pages):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for page in search_pages:
+            clean_page(page)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_page_us = best / len(search_pages) * 1e6
+    print(f"{label:<32} {best * 1000:8.2f} ms gesamt  {per_page_us:8.1f} µs pro Suchseite")
+    return best
+
+if __name__ == "__main__":
+    search_pages = build_pages()
+    all_titles = {title for page in search_pages for title in page}
+    all_titles.update(base + suffix for base in BASE_TITLES for suffix in SUFFIXES)
+
+    # Ausgabe muss exakt identisch bleiben
+    mismatches = [t for t in all_titles if legacy_clean(t) != music_quiz.clean_track_name(t)]
+    if mismatches:
+        raise SystemExit(f"Abweichende Ergebnisse für: {mismatches[:5]}")
+    print(f"{len(all_titles)} verschiedene Titel geprüft, alle Ergebnisse identisch.\n")
+
+    legacy = run("Alte Schleife (re.sub)", lambda page: [legacy_clean(t) for t in page], search_pages)
+
+    def compiled_cold(page):
+        music_quiz.clean_track_name.cache_clear()
+        return music_quiz.clean_track_names(page)
+    cold = run("Kompiliert, ohne Memo", compiled_cold, search_pages)
+
+    music_quiz.clean_track_name.cache_clear()
+    warm = run("Kompiliert, mit Memo (Batch)", music_quiz.clean_track_names, search_pages)
+
+    print(f"\nBeschleunigung ohne Memo: {legacy / cold:5.1f}x")
+    print(f"Beschleunigung mit Memo:  {legacy / warm:5.1f}x")
@@ -0,0 +1,369 @@
+# --------------------
+# Lokaler Ersatz für die Spotify Web API und den Accounts-Dienst (für Last- und Benchmarktests)
+# Liefert feste Tracks, Suchseiten und Cover, mit einstellbarer Latenz und 429-Injektion.
+# Aufruf: python benchmarks/spotify_stub.py [--port 8900] [--latency-ms 30] [--rate-429 0.01]
+# Die App wird mit SPOTIFY_API_URL=http://127.0.0.1:8900/v1/ und
+# SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:8900 darauf umgelenkt.
+# --------------------
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from PIL import Image, ImageDraw
+
+# --- EINSTELLUNGEN ---
+latency_ms = 30             # Grundlatenz jeder Antwort
+latency_jitter_ms = 20      # Zusätzlich zufällig 0..jitter
+rate_429 = 0.0              # Anteil der API-Aufrufe, die mit 429 beantwortet werden
+retry_after_seconds = 1
+catalog_size = 200          # Anzahl der festen Tracks
+search_page_size = 50
+playlist_page_size = 100    # Wie die echte API: höchstens 100 Einträge pro Seite
+# --- ENDE DER EINSTELLUNGEN ---
+
+BASE_TITLES = [
+    "Bohemian Rhapsody", "Hotel California", "Wonderwall", "Billie Jean", "Hey Jude",
+    "Smells Like Teen Spirit", "Like a Rolling Stone", "Imagine", "Purple Rain", "Dancing Queen",
+    "Superstition", "Africa", "Take On Me", "Sweet Child O' Mine", "Let It Be",
+]
+SUFFIXES = ["", " - 2011 Remaster", " - Live", " (Remastered)", " - Radio Edit", " - Mono"]
+ARTISTS = ["Queen", "Eagles", "Oasis", "Michael Jackson", "The Beatles", "Nirvana", "Bob Dylan",
+           "John Lennon", "Prince", "ABBA", "Stevie Wonder", "Toto", "a-ha", "Guns N' Roses"]
+
+def _spotify_id(prefix, n):
+    """22 Zeichen wie echte Spotify-IDs."""
+    return f"{prefix}{n:0{22 - len(prefix)}d}"
+
+class StubState:
+    """Katalog, Wiedergabezustand pro Konto und Aufrufzähler des Stubs."""
+    def __init__(self, base_url, seed=42):
+        self.base_url = base_url
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tracks = [self._make_track(n) for n in range(catalog_size)]
+        self.by_uri = {track['uri']: n for n, track in enumerate(self.tracks)}
+        self.players = {}      # user_id -> {'index', 'order', 'is_playing', 'started', 'progress'}
+        self.tokens = {}       # access_token -> user_id
+        self.refresh = {}      # refresh_token -> user_id
+        self.next_user = 0
+        self.calls = {}        # Endpunkt -> Anzahl
+        self.injected_429 = 0
+        self.unknown = 0       # Aufrufe, die der Stub nicht nachbildet (404)
+        self._covers = {}
+
+    def _make_track(self, n):
+        title = BASE_TITLES[n % len(BASE_TITLES)] + SUFFIXES[(n // len(BASE_TITLES)) % len(SUFFIXES)]
+        artist = ARTISTS[n % len(ARTISTS)]
+        year = 1965 + self.rng.randrange(55)
+        album_id = _spotify_id("al", n)
+        cover = f"{self.base_url}/covers/{album_id}.jpg"
+        return {
+            'id': _spotify_id("tr", n), 'type': 'track', 'name': title,
+            'duration_ms': 180000 + self.rng.randrange(120000),
+            'uri': f"spotify:track:{_spotify_id('tr', n)}",
+            'artists': [{'id': _spotify_id("ar", n % len(ARTISTS)), 'name': artist}],
+            'external_ids': {'isrc': f"STUB{n:08d}"},
+            'album': {
+                'id': album_id, 'name': f"Album {n}", 'release_date': f"{year}-01-01",
+                'images': [{'url': cover, 'width': 640, 'height': 640},
+                           {'url': cover, 'width': 300, 'height': 300},
+                           {'url': cover, 'width': 64, 'height': 64}],
+            },
+        }
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def player(self, user_id):
+        with self.lock:
+            return self.players.setdefault(user_id, {
+                'index': self.rng.randrange(len(self.tracks)), 'order': None, 'is_playing': True,
+                'started': time.time(), 'progress': 0,
+            })
+
+    def playback(self, user_id):
+        player = self.player(user_id)
+        track = self.tracks[player['index']]
+        progress = player['progress']
+        if player['is_playing']:
+            progress += int((time.time() - player['started']) * 1000)
+        if progress >= track['duration_ms']:
+            self.skip(user_id, 1)
+            return self.playback(user_id)
+        return {'item': track, 'is_playing': player['is_playing'], 'progress_ms': progress,
+                'currently_playing_type': 'track', 'shuffle_state': False,
+                'device': {'id': 'stub-device', 'name': 'Stub', 'type': 'Computer', 'is_active': True}}
+
+    def upcoming(self, user_id, count):
+        """Die nächsten Tracks: aus der gestarteten Liste, danach weiter im Katalog."""
+        player = self.player(user_id)
+        order = player['order'] or []
+        position = order.index(player['index']) + 1 if player['index'] in order else len(order)
+        indices = order[position:position + count]
+        last = indices[-1] if indices else player['index']
+        indices += [(last + i) % len(self.tracks) for i in range(1, count - len(indices) + 1)]
+        return [self.tracks[index] for index in indices]
+
+    def skip(self, user_id, step):
+        player = self.player(user_id)
+        with self.lock:
+            order = player['order'] or []
+            position = order.index(player['index']) + step if player['index'] in order else -1
+            if 0 <= position < len(order):
+                player['index'] = order[position]
+            else:
+                player['order'] = None
+                player['index'] = (player['index'] + step) % len(self.tracks)
+            player['progress'] = 0
+            player['started'] = time.time()
+
+    def play_list(self, user_id, uris):
+        """start_playback(uris=...): spielt die Liste ab dem ersten bekannten Track."""
+        order = [self.by_uri[uri] for uri in uris if uri in self.by_uri]
+        if not order:
+            return False
+        player = self.player(user_id)
+        with self.lock:
+            player.update(index=order[0], order=order, progress=0, started=time.time(), is_playing=True)
+        return True
+
+    def playlist_page(self, playlist_id, offset, limit):
+        """Jede Playlist enthält den ganzen Katalog; next verweist wie bei Spotify auf die Folgeseite."""
+        limit = min(limit, playlist_page_size)
+        items = [{'track': track} for track in self.tracks[offset:offset + limit]]
+        next_url = None
+        if offset + limit < len(self.tracks):
+            next_url = f"{self.base_url}/v1/playlists/{playlist_id}/tracks?{urlencode({'offset': offset + limit, 'limit': limit})}"
+        return {'items': items, 'offset': offset, 'limit': limit, 'total': len(self.tracks), 'next': next_url}
+
+    def set_playing(self, user_id, is_playing):
+        player = self.player(user_id)
+        with self.lock:
+            if player['is_playing'] and not is_playing:
+                player['progress'] += int((time.time() - player['started']) * 1000)
+            player['started'] = time.time()
+            player['is_playing'] = is_playing
+
+    def search(self, query):
+        """Eine Seite mit Varianten desselben Titels aus verschiedenen Jahren."""
+        rng = random.Random(query)
+        if query.startswith("isrc:"):
+            return self.search_isrc(query[len("isrc:"):], rng)
+        if query.startswith("track:"):
+            title = query[len("track:"):].split(" artist:")[0].lower()
+            matches = [t for t in self.tracks if t['name'].lower().startswith(title)] or self.tracks
+        else:
+            matches = self.tracks
+        if not matches:
+            return {'tracks': {'items': [], 'total': 0}}
+        template = rng.choice(matches)
+        items = []
+        for i in range(search_page_size):
+            item = json.loads(json.dumps(template))
+            item['id'] = _spotify_id("sr", rng.randrange(10 ** 9))
+            item['name'] = template['name'].split(" - ")[0] + rng.choice(SUFFIXES)
+            item['album']['name'] = f"Compilation {i}"
+            item['album']['release_date'] = f"{1960 + rng.randrange(60)}-01-01"
+            items.append(item)
+        return {'tracks': {'items': items, 'total': len(items)}}
+
+    def search_isrc(self, isrc, rng):
+        """
+        Wie bei Spotify findet ein ISRC nur dieselbe Aufnahme: bei jedem dritten Track
+        zusätzlich auf einem älteren Album, sonst (wie bei Remastern) nur sich selbst.
+        """
+        items = []
+        for n, track in enumerate(self.tracks):
+            if track['external_ids']['isrc'] != isrc:
+                continue
+            items.append(track)
+            if n % 3 == 0:
+                older = json.loads(json.dumps(track))
+                year = int(track['album']['release_date'][:4]) - 1 - rng.randrange(20)
+                older['album'].update(id=_spotify_id("og", n), name=f"Original {n}", release_date=f"{year}-01-01")
+                items.append(older)
+        return {'tracks': {'items': items, 'total': len(items)}}
+
+    def cover(self, album_id):
+        with self.lock:
+            cached = self._covers.get(album_id)
+        if cached is None:
+            rng = random.Random(album_id)
+            img = Image.new("RGB", (640, 640), tuple(rng.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(10):
+                x, y = rng.randrange(640), rng.randrange(640)
+                draw.ellipse((x, y, x + rng.randrange(60, 300), y + rng.randrange(60, 300)),
+                             fill=tuple(rng.randrange(256) for _ in range(3)))
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=85)
+            cached = buffer.getvalue()
+            with self.lock:
+                self._covers[album_id] = cached
+        return cached
+
+    def issue_token(self, user_id):
+        with self.lock:
+            access_token = f"stub-access-{user_id}-{self.rng.randrange(10 ** 12)}"
+            refresh_token = f"stub-refresh-{user_id}"
+            self.tokens[access_token] = user_id
+            self.refresh[refresh_token] = user_id
+        return {'access_token': access_token, 'token_type': 'Bearer', 'expires_in': 3600,
+                'refresh_token': refresh_token, 'scope': 'user-read-currently-playing user-modify-playback-state user-read-playback-state'}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-Alive wie bei der echten API
+    state = None                   # wird von start_stub() gesetzt
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else (json.dumps(body).encode() if body is not None else b"")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _delay(self):
+        time.sleep((latency_ms + random.random() * latency_jitter_ms) / 1000)
+
+    def _user(self):
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        return self.state.tokens.get(token)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        body = self._read_body()
+        state = self.state
+
+        # Accounts-Dienst
+        if path == "/authorize":
+            # Meldet reihum eines von mehreren Test-Konten an und leitet sofort zurück
+            with state.lock:
+                user_id = f"stub-user-{state.next_user}"
+                state.next_user += 1
+            params = {'code': user_id}
+            if 'state' in query:
+                params['state'] = query['state'][0]
+            return self._send(302, headers={"Location": f"{query['redirect_uri'][0]}?{urlencode(params)}"})
+        if path == "/api/token":
+            state.count("token")
+            form = parse_qs(body.decode())
+            if form.get('grant_type') == ['refresh_token']:
+                user_id = state.refresh.get(form.get('refresh_token', [''])[0])
+            else:
+                user_id = form.get('code', [''])[0]
+            if not user_id:
+                return self._send(400, {'error': 'invalid_grant'})
+            return self._send(200, state.issue_token(user_id))
+
+        # Cover (ohne künstliche Latenz; das echte CDN ist schnell)
+        if path.startswith("/covers/"):
+            state.count("cover")
+            return self._send(200, state.cover(path[len("/covers/"):-len(".jpg")]), content_type="image/jpeg")
+
+        if not path.startswith("/v1/"):
+            return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+        endpoint = f"{method} {path[len('/v1/'):]}"
+        state.count(endpoint)
+        self._delay()
+        if rate_429 and random.random() < rate_429:
+            with state.lock:
+                state.injected_429 += 1
+            return self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                              headers={"Retry-After": str(retry_after_seconds)})
+        user_id = self._user()
+        if user_id is None:
+            return self._send(401, {'error': {'status': 401, 'message': 'Invalid access token'}})
+
+        if endpoint == "GET me":
+            return self._send(200, {'id': user_id, 'display_name': user_id})
+        if endpoint in ("GET me/player/currently-playing", "GET me/player"):
+            return self._send(200, state.playback(user_id))
+        if endpoint == "GET me/player/queue":
+            index = state.player(user_id)['index']
+            return self._send(200, {'currently_playing': state.tracks[index], 'queue': state.upcoming(user_id, 20)})
+        if endpoint == "GET me/player/devices":
+            return self._send(200, {'devices': [{'id': 'stub-device', 'name': 'Stub', 'type': 'Computer', 'is_active': True}]})
+        if endpoint.startswith("GET playlists/") and endpoint.endswith("/tracks"):
+            playlist_id = endpoint[len("GET playlists/"):-len("/tracks")]
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', [str(playlist_page_size)])[0])
+            return self._send(200, state.playlist_page(playlist_id, offset, limit))
+        if endpoint == "GET search":
+            return self._send(200, state.search(query.get('q', [''])[0]))
+        if endpoint == "POST me/player/next":
+            state.skip(user_id, 1)
+            return self._send(204)
+        if endpoint == "POST me/player/previous":
+            state.skip(user_id, -1)
+            return self._send(204)
+        if endpoint == "PUT me/player/play":
+            uris = (json.loads(body) if body else {}).get('uris')
+            if uris:
+                if not state.play_list(user_id, uris):
+                    return self._send(400, {'error': {'status': 400, 'message': 'Invalid track uri'}})
+            else:
+                state.set_playing(user_id, True)
+            return self._send(204)
+        if endpoint == "PUT me/player/pause":
+            state.set_playing(user_id, False)
+            return self._send(204)
+        if endpoint in ("PUT me/player/seek", "PUT me/player/shuffle", "PUT me/player"):
+            return self._send(204)
+        with state.lock:
+            state.unknown += 1
+        return self._send(404, {'error': {'status': 404, 'message': f'Stub kennt {endpoint} nicht'}})
+
+def start_stub(host="127.0.0.1", port=0):
+    """Startet den Stub in einem Hintergrund-Thread; gibt (server, state, base_url) zurück."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    base_url = f"http://{host}:{server.server_address[1]}"
+    state = StubState(base_url)
+    StubHandler.state = state
+    threading.Thread(target=server.serve_forever, name="spotify-stub", daemon=True).start()
+    return server, state, base_url
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokaler Spotify-Ersatz für Lasttests")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=latency_ms)
+    parser.add_argument("--rate-429", type=float, default=rate_429)
+    args = parser.parse_args()
+    latency_ms = args.latency_ms
+    rate_429 = args.rate_429
+    server, state, base_url = start_stub(port=args.port)
+    print(f"Spotify-Stub läuft auf {base_url}")
+    print(f"  SPOTIFY_API_URL={base_url}/v1/  SPOTIFY_ACCOUNTS_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -8,17 +8,35 @@
 
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from flask import Flask, render_template_string, redirect, url_for, request, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, session, jsonify, Response, g, send_file, abort
 import re
 import os
 import time
 from dotenv import load_dotenv
 import json
+import hashlib
+import threading
+import queue
+import uuid
+import tempfile
+import cProfile
+import secrets
+import math
+import difflib
+import random
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict, deque
+from functools import lru_cache, wraps
+import redis
 
 # Angepasste Importe für die schlanke Farbanalyse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from io import BytesIO
-import colorsys
+import numpy as np
 from PIL import Image # Pillow wird jetzt direkt genutzt
 
 load_dotenv()
@@ -99,9 +117,866 @@ progress_bar_hover_increase_px = 5
 icon_svg = 'icon2.svg'
 icon_svg_sq = 'icon2-sq.svg'
 icon_png = 'icon2.png'
+year_cache_ttl_seconds = 7 * 24 * 3600      # Gefundene Originalversionen ändern sich praktisch nie
+year_cache_negative_ttl_seconds = 6 * 3600  # "Keine ältere Version gefunden" wird kürzer gemerkt
+year_cache_local_size = 1024                # Einträge im prozesslokalen LRU vor Redis
+cache_lock_timeout_seconds = 10             # Wie lange andere Worker auf eine laufende Suche warten
+palette_cache_ttl_seconds = 30 * 24 * 3600  # Cover eines Albums ändern sich praktisch nie
+palette_cache_negative_ttl_seconds = 600    # Fehlgeschlagene Analysen nur kurz merken
+palette_cache_local_size = 256              # Alben im prozesslokalen LRU vor Redis
+cover_display_size = 300                    # Kantenlänge des Covers in CSS-Pixeln (.album-art), größere Varianten per srcset
+cover_analysis_size = 64                    # Für die Farbanalyse reicht das kleinste Spotify-Cover
+cover_proxy = False                         # Cover über /cover/<album_id> mit Datei-Cache ausliefern statt direkt vom Spotify-CDN
+cover_cache_dir = os.path.join(tempfile.gettempdir(), 'music-quiz-covers')
+cover_cache_max_mb = 200                    # Darüber werden die am längsten nicht genutzten Cover gelöscht
+cover_browser_cache_seconds = 30 * 24 * 3600
+server_sent_events = False                  # Tabs per /events informieren statt /check-song zu pollen; braucht Threads oder gevent (siehe live_updates)
+check_song_min_interval_seconds = 1         # Kürzester Poll-Abstand kurz vor Songende
+check_song_max_interval_seconds = 15        # Längster Poll-Abstand mitten im Song (Skips am Handy fallen so spätestens dann auf)
+sse_stream_seconds = 300                    # Danach schließt der Server den Stream, der Browser verbindet neu
+sse_heartbeat_seconds = 15
+watcher_linger_seconds = 30                 # So lange pollt der Watcher noch, nachdem der letzte Tab weg ist
+playback_snapshot_ttl_ms = 300              # So lange teilen sich Routen eines Kontos ein currently_playing-Ergebnis
+command_confirm_timeout_seconds = 2.0       # Spätestens dann antwortet ein Steuerbefehl auch ohne Bestätigung
+command_confirm_interval_seconds = 0.15     # Erster Abstand der Statusabfragen nach einem Steuerbefehl
+command_confirm_max_interval_seconds = 0.6  # Die Abstände verdoppeln sich bis hierhin
+queue_enrichment = True                     # Jahr und Palette der nächsten Tracks im Hintergrund vorberechnen
+queue_enrichment_depth = 3                  # So viele Tracks aus der Warteschlange
+queue_enrichment_workers = 2
+queue_enrichment_retries = 3                # Vom Gateway abgelehnte Vorberechnungen so oft später wiederholen
+queue_enrichment_retry_seconds = 2.0        # Erste Wartezeit, verdoppelt sich bei jedem weiteren Versuch
+snapshot_workers = 8                        # Gemeinsamer Thread-Pool für parallele Schritte beim Seitenaufbau
+snapshot_palette_timeout_seconds = 2.0      # Danach wird mit der Standardpalette gerendert
+snapshot_release_timeout_seconds = 5.0      # Danach ohne Originalversion
+device_cache_ttl_seconds = 60               # Geräteliste pro Konto; der Track-Watcher hält sie aktuell
+last_device_ttl_seconds = 30 * 24 * 3600    # Zuletzt erfolgreich genutztes Gerät
+device_priorities = {'Smartphone': 1, 'Computer': 2, 'Speaker': 3}  # Reihenfolge ohne bekanntes Gerät
+guess_year_points = 10                      # Punkte für das exakte Jahr ...
+guess_year_penalty = 2                      # ... abzüglich dieser Punkte pro Jahr Abstand
+guess_name_points = 5                       # Je für Interpret und Titel
+guess_name_min_ratio = 0.8                  # Ähnlichkeit, ab der ein Name als richtig gilt (Tippfehler)
+leaderboard_size = 10
+random_playlist_id = "76urfTElnBTZh1HXxDckec"  # Quelle für "Zufälliger Song aus Playlist"
+deck_mode = True                            # Vorab gemischtes Deck statt Spotify-Shuffle bei jedem Klick
+deck_size = 20                              # So viele Songs werden auf einmal gezogen und eingereiht
+playlist_cache_ttl_seconds = 3600           # Titelliste der Playlist, geteilt über alle Konten
+room_ttl_seconds = 12 * 3600                # Räume ohne Änderung verfallen danach
+room_code_length = 8                        # 32^8 Codes: Raten lohnt sich nicht, zumal Fehlversuche gebremst werden
+room_join_failures_per_minute = 10          # Danach lehnt /room/<code> weitere Versuche dieser IP für eine Minute ab
+server_side_tokens = True                   # Mit Redis: Tokens serverseitig, im Cookie nur eine Session-ID
+token_session_ttl_seconds = 30 * 24 * 3600  # Ohne Anfrage in diesem Zeitraum verfällt die Server-Session
+token_renew_ahead_seconds = 300             # So lange vor Ablauf erneuert der Hintergrund-Thread ein Token
+token_renew_interval_seconds = 30
+token_renew_idle_seconds = 2 * 3600         # Nur Sessions mit Anfragen in diesem Zeitraum werden vorab erneuert
+http_connect_timeout_seconds = 3.05
+spotify_read_timeout_seconds = 10
+cover_read_timeout_seconds = 5
+http_max_retries = 3                        # Nur Verbindungsfehler und 5xx bei GET; 429 behandelt der Aufrufer
+http_backoff_factor = 0.3
+http_pool_sizes = {                         # Keep-Alive-Verbindungen pro Host und Worker
+    'https://api.spotify.com': 20,
+    'https://accounts.spotify.com': 4,
+    'https://i.scdn.co': 10,                # Spotify-CDN für Album-Cover
+}
+http_default_pool_size = 4                  # Für alle anderen Hosts (z.B. fremde Cover-URLs)
+profile_sample_rate = 0.0                   # Anteil zufällig profilierter Anfragen (nur Zeitabschnitte, ohne cProfile)
+profile_slow_ms = 500                       # Profilierte Anfragen ab dieser Dauer erscheinen unter /debug/slow-requests
+profile_keep = 50                           # So viele profilierte Anfragen werden aufgehoben
+profile_dir = os.path.join(tempfile.gettempdir(), 'music-quiz-profiles')  # cProfile-Dumps
+metrics_flush_seconds = 5                   # So oft legt jeder Worker seine Metriken für /metrics in Redis ab
+spotify_global_rate_per_second = 10         # Spotify drosselt pro App, also über alle Konten und Worker
+spotify_global_burst = 30
+spotify_account_rate_per_second = 3
+spotify_account_burst = 10
+spotify_priority_reserves = {               # Anteil der Buckets, der für wichtigere Aufrufe frei bleibt
+    'command': 0.0,                         # Weiter, Seek, Play/Pause, ...
+    'state': 0.2,                           # Wiedergabestatus
+    'background': 0.5,                      # Vorberechnung der Warteschlange, Geräteliste im Watcher
+}
+spotify_max_wait_seconds = {                # So lange wird höchstens verzögert, danach abgelehnt
+    'command': 5.0,
+    'state': 1.0,
+    'background': 0.0,
+}
 # --- ENDE DER EINSTELLUNGEN ---
 
+# Live-Updates lassen sich auch ohne Codeänderung einschalten, z.B. SERVER_SENT_EVENTS=1 zusammen mit gunicorn --worker-class gthread
+if os.environ.get('SERVER_SENT_EVENTS'):
+    server_sent_events = os.environ['SERVER_SENT_EVENTS'].lower() in ('1', 'true', 'yes', 'on')
+
+# Für Lasttests lässt sich die App auf einen lokalen Spotify-Ersatz umlenken (benchmarks/spotify_stub.py)
+SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL')            # z.B. http://127.0.0.1:8900/v1/
+SPOTIFY_ACCOUNTS_URL = os.environ.get('SPOTIFY_ACCOUNTS_URL')  # z.B. http://127.0.0.1:8900
+# Schaltet das Profiling per ?profile=<Token> bzw. X-Profile-Header frei, dazu /debug/slow-requests und die Statistik-Routen
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
 TOKEN_INFO_KEY = 'spotify_token_info'
+TOKEN_SID_KEY = 'token_sid'
+
+# --- HTTP-VERBINDUNGEN ---
+
+class PooledSession(requests.Session):
+    """
+    Prozessweite Session mit Keep-Alive-Pools. spotipy schließt im __del__ jedes
+    Clients dessen Session, was den Pool nach jeder Anfrage leeren würde; close()
+    ist hier deshalb wirkungslos.
+    """
+    def close(self):
+        pass
+
+def build_http_session():
+    retry = Retry(
+        total=http_max_retries,
+        read=False,                         # Steuerbefehle nie doppelt senden
+        status=http_max_retries,
+        allowed_methods=frozenset(['GET']),
+        status_forcelist=(500, 502, 503, 504),
+        backoff_factor=http_backoff_factor,
+        # Nach dem letzten Versuch die echte 5xx-Antwort weitergeben; sonst macht spotipy
+        # aus dem RetryError ein 429 "Max Retries" ohne Retry-After
+        raise_on_status=False,
+    )
+    http = PooledSession()
+    http.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=http_default_pool_size, max_retries=retry))
+    http.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=http_default_pool_size, max_retries=retry))
+    # requests wählt pro URL den Adapter mit dem längsten passenden Präfix
+    for prefix, pool_size in http_pool_sizes.items():
+        http.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+    return http
+
+http_session = build_http_session()
+SPOTIFY_TIMEOUT = (http_connect_timeout_seconds, spotify_read_timeout_seconds)
+COVER_TIMEOUT = (http_connect_timeout_seconds, cover_read_timeout_seconds)
+
+def http_pool_stats():
+    """
+    Anfragen und neu aufgebaute Verbindungen je Host in diesem Worker. Eine hohe
+    Wiederverwendung bedeutet, dass kaum TCP/TLS-Handshakes anfallen.
+    """
+    stats = {}
+    for adapter in http_session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}"
+            entry = stats.setdefault(host, {'requests': 0, 'connections': 0})
+            entry['requests'] += pool.num_requests
+            entry['connections'] += pool.num_connections
+    for entry in stats.values():
+        requests_made = entry['requests']
+        entry['reuse_ratio'] = round(1 - entry['connections'] / requests_made, 3) if requests_made else None
+    return stats
+
+# --- ENDE DER HTTP-VERBINDUNGEN ---
+
+# --- GEMEINSAMER CACHE (LRU + REDIS) ---
+
+REDIS_URL = os.environ.get('REDIS_URL')
+_redis_client = None
+_redis_checked = False
+
+def get_redis():
+    """
+    Gibt einen gemeinsamen Redis-Client zurück. Ohne REDIS_URL oder wenn Redis
+    beim Start nicht erreichbar ist, wird None geliefert und nur lokal gecacht.
+    """
+    global _redis_client, _redis_checked
+    if _redis_checked:
+        return _redis_client
+    _redis_checked = True
+    if not REDIS_URL:
+        return None
+    try:
+        client = redis.Redis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+        client.ping()
+        _redis_client = client
+    except redis.RedisError as e:
+        print(f"Redis nicht erreichbar, nutze nur lokalen Cache: {e}")
+    return _redis_client
+
+class SharedCache:
+    """
+    Zweistufiger Cache: ein kleiner LRU im Prozess vor einem optionalen Redis,
+    damit alle Gunicorn-Worker dieselben Ergebnisse sehen. None-Werte werden
+    als negatives Ergebnis mit eigener (kürzerer) TTL gespeichert.
+    """
+    def __init__(self, namespace, maxsize, ttl, negative_ttl=None):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._inflight = {}          # key -> threading.Event der laufenden Berechnung
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, key):
+        return f"music-quiz:{self.namespace}:{key}"
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._local[key]
+                return False, None
+            self._local.move_to_end(key)
+            return True, value
+
+    def _set_local(self, key, value, ttl):
+        with self._lock:
+            self._local[key] = (time.time() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def get(self, key, count=True):
+        """
+        Liefert (hit, value). value darf None sein (negativ gecacht).
+        Mit count=False wird die Abfrage nicht in den Trefferzählern erfasst.
+        """
+        hit, value = self._get_local(key)
+        if hit:
+            if count:
+                self.local_hits += 1
+            return True, value
+        r = get_redis()
+        raw = None
+        if r is not None:
+            try:
+                raw = r.get(self._redis_key(key))
+                ttl_ms = r.pttl(self._redis_key(key)) if raw is not None else None
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Lesen ({self.namespace}): {e}")
+                raw = None
+        if raw is None:
+            if count:
+                self.misses += 1
+            return False, None
+        if count:
+            self.redis_hits += 1
+        value = json.loads(raw)
+        local_ttl = ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else self.ttl
+        self._set_local(key, value, local_ttl)
+        return True, value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self._set_local(key, value, ttl)
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            r.set(self._redis_key(key), json.dumps(value), ex=int(ttl))
+        except redis.RedisError as e:
+            print(f"Redis-Fehler beim Schreiben ({self.namespace}): {e}")
+
+    def stats(self):
+        """Trefferzähler dieses Prozesses (seit dem Start des Workers)."""
+        lookups = self.local_hits + self.redis_hits + self.misses
+        hits = self.local_hits + self.redis_hits
+        return {
+            'local_hits': self.local_hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+            'local_size': len(self._local),
+        }
+
+    def get_or_compute(self, key, compute):
+        """
+        Gibt den gecachten Wert zurück oder berechnet ihn genau einmal. Parallele
+        Anfragen im selben Prozess warten auf die laufende Berechnung, andere
+        Worker über einen kurzlebigen Redis-Lock.
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        with self._lock:
+            event = self._inflight.get(key)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not is_leader:
+            event.wait(cache_lock_timeout_seconds)
+            hit, value = self.get(key, count=False)
+            return value if hit else compute()
+
+        try:
+            return self._compute_with_redis_lock(key, compute)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _compute_with_redis_lock(self, key, compute):
+        r = get_redis()
+        lock_key = self._redis_key(key) + ":lock"
+        token = uuid.uuid4().hex
+        have_lock = False
+        if r is not None:
+            try:
+                have_lock = bool(r.set(lock_key, token, nx=True, px=cache_lock_timeout_seconds * 1000))
+                if not have_lock:
+                    # Ein anderer Worker sucht bereits: auf dessen Ergebnis warten
+                    deadline = time.time() + cache_lock_timeout_seconds
+                    while time.time() < deadline and r.exists(lock_key):
+                        time.sleep(0.05)
+                        hit, value = self.get(key, count=False)
+                        if hit:
+                            return value
+                    hit, value = self.get(key, count=False)
+                    if hit:
+                        return value
+            except redis.RedisError as e:
+                print(f"Redis-Lock nicht verfügbar ({self.namespace}): {e}")
+
+        try:
+            value = compute()
+            self.set(key, value)
+            return value
+        finally:
+            if have_lock:
+                try:
+                    if r.get(lock_key) == token.encode():
+                        r.delete(lock_key)
+                except redis.RedisError:
+                    pass
+
+# --- ENDE DES CACHES ---
+
+# --- METRIKEN (PROMETHEUS-TEXTFORMAT) ---
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    """
+    Zähler und Latenz-Histogramme ohne zusätzliche Abhängigkeit. Jeder Worker zählt
+    lokal und legt regelmäßig einen Snapshot in Redis ab; /metrics summiert die
+    Snapshots aller laufenden Worker. Ohne Redis zeigt /metrics nur diesen Prozess.
+    """
+    SNAPSHOT_PREFIX = "music-quiz:metrics:"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> Wert
+        self._histograms = {}  # (name, labels) -> [Bucket-Zähler..., Summe, Anzahl]
+        self._help = {}        # name -> (Typ, Beschreibung)
+        self._collectors = []  # Funktionen, die beim Snapshot weitere Zähler liefern
+        self._worker_id = uuid.uuid4().hex
+        self._flusher = None
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._ensure_flusher()
+
+    def observe(self, name, seconds, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += seconds
+            entry[-1] += 1
+        self._ensure_flusher()
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def register_collector(self, collector):
+        """collector() liefert {(name, labels-dict): Wert} für Zähler, die woanders geführt werden."""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            counters = {json.dumps([name, labels]): value for (name, labels), value in self._counters.items()}
+            histograms = {json.dumps([name, labels]): list(entry) for (name, labels), entry in self._histograms.items()}
+        for collector in self._collectors:
+            for (name, labels), value in collector():
+                counters[json.dumps([name, sorted(labels.items())])] = value
+        return {'counters': counters, 'histograms': histograms}
+
+    def flush(self):
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            r.set(self.SNAPSHOT_PREFIX + self._worker_id, json.dumps(self.snapshot()),
+                  ex=max(1, int(metrics_flush_seconds * 3)))
+        except redis.RedisError as e:
+            print(f"Redis-Fehler beim Ablegen der Metriken: {e}")
+
+    def _ensure_flusher(self):
+        if self._flusher is not None or get_redis() is None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(metrics_flush_seconds)
+            self.flush()
+
+    def collect(self):
+        """Summe der Snapshots aller Worker (mit Redis) bzw. dieses Prozesses."""
+        snapshots = [self.snapshot()]
+        r = get_redis()
+        if r is not None:
+            try:
+                self.flush()
+                keys = list(r.scan_iter(match=self.SNAPSHOT_PREFIX + "*", count=100))
+                snapshots = [json.loads(raw) for raw in r.mget(keys) if raw] if keys else snapshots
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Lesen der Metriken, zeige nur diesen Worker: {e}")
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for key, value in snapshot['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for key, entry in snapshot['histograms'].items():
+                total = histograms.setdefault(key, [0] * len(entry))
+                for i, value in enumerate(entry):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self):
+        """Prometheus-Textformat (Version 0.0.4)."""
+        counters, histograms = self.collect()
+        families = {}
+        for key, value in counters.items():
+            name, labels = json.loads(key)
+            families.setdefault(name, []).append(('counter', labels, value))
+        for key, entry in histograms.items():
+            name, labels = json.loads(key)
+            families.setdefault(name, []).append(('histogram', labels, entry))
+
+        lines = []
+        for name in sorted(families):
+            samples = families[name]
+            kind, help_text = self._help.get(name, (samples[0][0], name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_kind, labels, value in sorted(samples, key=lambda sample: sample[1]):
+                if sample_kind == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + [['le', str(bound)]])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + [['le', '+Inf']])} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+metrics = Metrics()
+metrics.describe('music_quiz_http_request_duration_seconds', 'histogram', 'Dauer der Flask-Anfragen je Route')
+metrics.describe('music_quiz_spotify_request_duration_seconds', 'histogram', 'Dauer der Spotify-API-Aufrufe je Endpunkt')
+metrics.describe('music_quiz_spotify_requests_total', 'counter', 'Spotify-API-Aufrufe je Endpunkt und Ergebnis (ok, error, rate_limited, rejected)')
+metrics.describe('music_quiz_cover_download_seconds', 'histogram', 'Download der Album-Cover')
+metrics.describe('music_quiz_cover_quantize_seconds', 'histogram', 'Verkleinern und Quantisieren der Album-Cover')
+metrics.describe('music_quiz_cache_requests_total', 'counter', 'Cache-Abfragen je Cache und Ergebnis (local_hit, redis_hit, miss)')
+metrics.describe('music_quiz_cover_proxy_total', 'counter', 'Anfragen an /cover je Ergebnis (hit, miss)')
+metrics.describe('music_quiz_snapshot_step_timeouts_total', 'counter', 'Schritte beim Seitenaufbau, die ihr Zeitlimit überschritten haben')
+
+# --- ENDE DER METRIKEN ---
+
+# --- PROFILING EINZELNER ANFRAGEN ---
+
+_request_profile = contextvars.ContextVar('request_profile', default=None)
+
+class RequestProfile:
+    """Zeitabschnitte (Spans) einer Anfrage, auch aus den Threads von run_parallel_steps()."""
+    def __init__(self, method, path, endpoint, reason):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.reason = reason          # 'requested' oder 'sampled'
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.cprofile = None
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end):
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start_ms': round((start - self.started) * 1000, 1),
+                'duration_ms': round((end - start) * 1000, 1),
+                'thread': threading.current_thread().name,
+            })
+
+    def breakdown(self):
+        """Summe je Span-Name, längste zuerst."""
+        totals = {}
+        for span_info in self.spans:
+            totals[span_info['name']] = totals.get(span_info['name'], 0) + span_info['duration_ms']
+        return sorted(((name, round(ms, 1)) for name, ms in totals.items()), key=lambda item: -item[1])
+
+@contextmanager
+def span(name):
+    """Misst einen Abschnitt, aber nur in profilierten Anfragen; sonst kostet er fast nichts."""
+    profile = _request_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, start, time.perf_counter())
+
+class SlowRequestLog:
+    """Die letzten profilierten Anfragen, mit Redis über alle Worker, sonst pro Worker."""
+    KEY = "music-quiz:slow-requests"
+
+    def __init__(self):
+        self._local = deque(maxlen=profile_keep)
+
+    def add(self, record):
+        r = get_redis()
+        if r is None:
+            self._local.appendleft(record)
+            return
+        try:
+            pipe = r.pipeline()
+            pipe.lpush(self.KEY, json.dumps(record))
+            pipe.ltrim(self.KEY, 0, profile_keep - 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Profil nicht gespeichert: {e}")
+            self._local.appendleft(record)
+
+    def recent(self):
+        r = get_redis()
+        if r is not None:
+            try:
+                return [json.loads(raw) for raw in r.lrange(self.KEY, 0, profile_keep - 1)]
+            except redis.RedisError as e:
+                print(f"Profile nicht lesbar: {e}")
+        return list(self._local)
+
+slow_requests = SlowRequestLog()
+
+def is_admin(token):
+    return bool(ADMIN_TOKEN and token and secrets.compare_digest(token, ADMIN_TOKEN))
+
+def admin_only(view):
+    """
+    Nur mit ADMIN_TOKEN: als ?token=, X-Profile-Header oder Authorization: Bearer (so fragt
+    Prometheus mit bearer_token). Ohne gültiges Token gibt es die Route nicht (404).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        authorization = request.headers.get('Authorization', '')
+        bearer = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+        if not is_admin(request.args.get('token') or request.headers.get('X-Profile') or bearer):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+def finish_request_profile(profile, status):
+    """Schließt das Profil ab; angeforderte und langsame Anfragen kommen ins SlowRequestLog."""
+    total_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+    dump_file = None
+    if profile.cprofile is not None:
+        profile.cprofile.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        dump_file = os.path.join(profile_dir, f"{int(profile.started_at)}-{profile.endpoint}-{os.getpid()}.prof")
+        profile.cprofile.dump_stats(dump_file)
+    if profile.reason == 'requested' or total_ms >= profile_slow_ms:
+        slow_requests.add({
+            'time': profile.started_at,
+            'method': profile.method,
+            'path': profile.path,
+            'status': status,
+            'total_ms': total_ms,
+            'reason': profile.reason,
+            'breakdown': profile.breakdown(),
+            'spans': sorted(profile.spans, key=lambda span_info: span_info['start_ms']),
+            'cprofile': dump_file,
+        })
+    return total_ms
+
+# --- ENDE DES PROFILINGS ---
+
+# --- SPOTIFY-GATEWAY (RATE-LIMITS UND PRIORITÄTEN) ---
+
+PRIORITY_COMMAND = 'command'
+PRIORITY_STATE = 'state'
+PRIORITY_BACKGROUND = 'background'
+
+# Token-Buckets in Redis: KEYS[1] = Retry-After-Sperre, danach die Buckets.
+# ARGV = jetzt, dann je Bucket (Rate, Burst, Reserve). Liefert {Grund, Wartezeit};
+# Wartezeit 0 heißt, dass aus allen Buckets ein Token entnommen wurde.
+_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local blocked_until = tonumber(redis.call('GET', KEYS[1]) or '0')
+if blocked_until > now then
+    return {'retry-after', tostring(blocked_until - now)}
+end
+local wait = 0
+local levels = {}
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[3 * i - 4])
+    local burst = tonumber(ARGV[3 * i - 3])
+    local reserve = tonumber(ARGV[3 * i - 2])
+    local data = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or burst
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens - 1 < reserve then
+        wait = math.max(wait, (reserve + 1 - tokens) / rate)
+    end
+end
+for i = 2, #KEYS do
+    local tokens = levels[i]
+    if wait == 0 then tokens = tokens - 1 end
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], 3600)
+end
+return {'bucket', tostring(wait)}
+"""
+
+_spotify_priority = contextvars.ContextVar('spotify_priority', default=None)
+
+@contextmanager
+def spotify_priority(priority):
+    """Setzt die Priorität aller Spotify-Aufrufe im Block (z.B. für Hintergrund-Threads)."""
+    token = _spotify_priority.set(priority)
+    try:
+        yield
+    finally:
+        _spotify_priority.reset(token)
+
+def spotify_priority_for(method, url):
+    """
+    Ohne explizite Priorität: Befehle (PUT/POST) vor allen Abfragen. Auch die Suche nach der
+    Originalversion zählt als Abfrage, denn beim Auflösen und Werten wartet jemand darauf;
+    nur Hintergrundarbeit setzt spotify_priority(PRIORITY_BACKGROUND).
+    """
+    priority = _spotify_priority.get()
+    if priority is not None:
+        return priority
+    if method != 'GET':
+        return PRIORITY_COMMAND
+    return PRIORITY_STATE
+
+class SpotifyRateLimited(spotipy.exceptions.SpotifyException):
+    """Das Gateway hat einen Aufruf abgelehnt: eigene Drossel oder Retry-After von Spotify."""
+    def __init__(self, retry_after, reason):
+        super().__init__(429, -1, f"Spotify-Aufruf gedrosselt ({reason}), erneut in {retry_after:.1f}s",
+                         reason=reason, headers={'Retry-After': str(math.ceil(retry_after))})
+        self.retry_after = retry_after
+
+class SpotifyGateway:
+    """
+    Alle Spotify-API-Aufrufe laufen hier durch. Ein globaler und ein Bucket pro Konto
+    begrenzen die Rate; niedrige Prioritäten dürfen die Buckets nur bis zu ihrer
+    Reserve leeren und werden zuerst verzögert oder verworfen. Ein 429 mit Retry-After
+    sperrt alle Aufrufe, mit Redis über alle Worker hinweg.
+    """
+    BLOCK_KEY = "music-quiz:spotify:retry-after"
+    BUCKET_PREFIX = "music-quiz:spotify:bucket:"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local_buckets = {}   # Schlüssel -> (tokens, ts), falls Redis fehlt
+        self._blocked_until = 0.0
+        self._script = None
+        self._counters = {priority: {'calls': 0, 'delayed': 0, 'rejected': 0, 'throttled': 0}
+                          for priority in spotify_priority_reserves}
+
+    def _limits(self, account_key, priority):
+        buckets = [('global', spotify_global_rate_per_second, spotify_global_burst),
+                   (f"account:{account_key}", spotify_account_rate_per_second, spotify_account_burst)]
+        reserve = spotify_priority_reserves[priority]
+        return [(name, rate, burst, reserve * burst) for name, rate, burst in buckets]
+
+    def _take(self, account_key, priority):
+        """Entnimmt ein Token; gibt (Grund, Wartezeit) zurück, Wartezeit 0 bei Erfolg."""
+        limits = self._limits(account_key, priority)
+        now = time.time()
+        r = get_redis()
+        if r is not None:
+            try:
+                if self._script is None:
+                    self._script = r.register_script(_TOKEN_BUCKET_SCRIPT)
+                keys = [self.BLOCK_KEY] + [self.BUCKET_PREFIX + name for name, _, _, _ in limits]
+                args = [now] + [value for _, rate, burst, reserve in limits for value in (rate, burst, reserve)]
+                reason, wait = self._script(keys=keys, args=args)
+                return reason.decode(), float(wait)
+            except redis.RedisError as e:
+                print(f"Redis-Fehler im Spotify-Gateway, drossle nur lokal: {e}")
+        with self._lock:
+            if self._blocked_until > now:
+                return 'retry-after', self._blocked_until - now
+            wait = 0.0
+            levels = {}
+            for name, rate, burst, reserve in limits:
+                tokens, ts = self._local_buckets.get(name, (burst, now))
+                tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+                levels[name] = tokens
+                if tokens - 1 < reserve:
+                    wait = max(wait, (reserve + 1 - tokens) / rate)
+            for name, tokens in levels.items():
+                self._local_buckets[name] = (tokens - 1 if wait == 0 else tokens, now)
+            return 'bucket', wait
+
+    def block(self, seconds):
+        """Merkt sich ein Retry-After von Spotify für alle Worker."""
+        until = time.time() + seconds
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, until)
+        r = get_redis()
+        if r is not None:
+            try:
+                r.set(self.BLOCK_KEY, until, px=max(1, int(seconds * 1000)))
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Speichern von Retry-After: {e}")
+
+    def call(self, account_key, priority, send):
+        deadline = time.monotonic() + spotify_max_wait_seconds[priority]
+        delayed = False
+        while True:
+            reason, wait = self._take(account_key, priority)
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                self._count(priority, 'rejected')
+                raise SpotifyRateLimited(wait, reason)
+            delayed = True
+            time.sleep(wait)
+        self._count(priority, 'delayed' if delayed else 'calls')
+        try:
+            return send()
+        except spotipy.exceptions.SpotifyException as e:
+            # Nur ein 429 mit Retry-After stammt sicher von Spotifys Drossel; alles andere ist ein gewöhnlicher Fehler
+            retry_after = spotify_retry_after(e)
+            if retry_after is not None:
+                self._count(priority, 'throttled')
+                print(f"Spotify meldet 429, pausiere alle Aufrufe für {retry_after:.0f}s")
+                self.block(retry_after)
+            raise
+
+    def _count(self, priority, name):
+        with self._lock:
+            self._counters[priority][name] += 1
+            if name == 'delayed':
+                self._counters[priority]['calls'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {priority: dict(counters) for priority, counters in self._counters.items()}
+
+spotify_gateway = SpotifyGateway()
+
+def spotify_retry_after(error):
+    """Sekunden aus dem Retry-After eines 429, None für andere Fehler und 429 ohne den Header."""
+    if error.http_status != 429:
+        return None
+    try:
+        return float((error.headers or {})['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# Endpunkt-Namen für die Metriken, wie die spotipy-Methoden
+SPOTIFY_ENDPOINTS = {
+    ('GET', 'me/player/currently-playing'): 'currently_playing',
+    ('GET', 'me/player'): 'current_playback',
+    ('PUT', 'me/player'): 'transfer_playback',
+    ('PUT', 'me/player/play'): 'start_playback',
+    ('PUT', 'me/player/pause'): 'pause_playback',
+    ('POST', 'me/player/next'): 'next_track',
+    ('POST', 'me/player/previous'): 'previous_track',
+    ('PUT', 'me/player/seek'): 'seek_track',
+    ('PUT', 'me/player/shuffle'): 'shuffle',
+    ('GET', 'me/player/devices'): 'devices',
+    ('GET', 'me/player/queue'): 'queue',
+    ('GET', 'me'): 'current_user',
+    ('GET', 'search'): 'search',
+}
+_SPOTIFY_ID = re.compile(r"/[0-9A-Za-z]{22}(?=/|$)")
+
+def spotify_endpoint_name(method, url):
+    path = url.split('?')[0]
+    if path.startswith('http'):
+        path = path.split('/v1/', 1)[-1]
+    path = path.strip('/')
+    # Unbekannte Endpunkte ohne IDs, damit die Zahl der Label-Werte begrenzt bleibt
+    return SPOTIFY_ENDPOINTS.get((method, path)) or f"{method} {_SPOTIFY_ID.sub('/:id', '/' + path)[1:]}"
+
+class GatedSpotify(spotipy.Spotify):
+    """spotipy-Client, dessen API-Aufrufe alle durch das Spotify-Gateway laufen."""
+    def __init__(self, *args, account_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Spotify-ID des Kontos: ein Bucket pro Konto, über Token-Erneuerungen und Bildschirme hinweg
+        self.account_key = account_key
+        if SPOTIFY_API_URL:
+            self.prefix = SPOTIFY_API_URL
+
+    def _internal_call(self, method, url, payload, params):
+        # Nur bis die Spotify-ID bekannt ist (erster /me-Aufruf einer Session) über das Access-Token
+        account_key = self.account_key or hashlib.sha1(str(self._auth).encode()).hexdigest()[:16]
+        endpoint = spotify_endpoint_name(method, url)
+        send = super()._internal_call
+
+        def timed_send():
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = send(method, url, payload, params)
+                outcome = 'ok'
+                return result
+            except spotipy.exceptions.SpotifyException as e:
+                outcome = 'rate_limited' if spotify_retry_after(e) is not None else 'error'
+                raise
+            finally:
+                metrics.observe('music_quiz_spotify_request_duration_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+                metrics.inc('music_quiz_spotify_requests_total', {'endpoint': endpoint, 'outcome': outcome})
+
+        try:
+            with span(f"spotify {endpoint}"):
+                return spotify_gateway.call(account_key, spotify_priority_for(method, url), timed_send)
+        except SpotifyRateLimited:
+            metrics.inc('music_quiz_spotify_requests_total', {'endpoint': endpoint, 'outcome': 'rejected'})
+            raise
+
+# --- ENDE DES SPOTIFY-GATEWAYS ---
 
 # --- FUNKTIONEN FÜR DIE FARBANALYSE ---
 
@@ -123,81 +998,663 @@ def get_text_color_for_bg(hex_color):
     except:
         return '#FFFFFF'
 
-def analyze_album_art(image_url):
+# Schwellen für die Akzentfarbe
+MIN_SATURATION = 0.25  # Anforderung für eine "ideale" Akzentfarbe
+MIN_VALUE = 0.5
+
+def pick_cover_image(images, min_size):
     """
-    Analysiert ein Album-Cover mit einer mehrstufigen Logik, 
-    um eine ästhetisch ansprechende Akzentfarbe zu finden.
+    Kleinste Spotify-Variante eines Covers mit mindestens min_size Pixeln Kantenlänge,
+    sonst die größte. Varianten ohne Größenangabe gelten als groß.
     """
-    # 1. Strengere Filter definieren
-    MIN_SATURATION = 0.25  # Anforderung für eine "ideale" Akzentfarbe
-    MIN_VALUE = 0.5
+    if not images:
+        return None
+    by_size = sorted(images, key=lambda image: image.get('width') or math.inf)
+    for image in by_size:
+        if (image.get('width') or math.inf) >= min_size:
+            return image
+    return by_size[-1]
+
+def cover_srcset(images):
+    """srcset-Wert mit allen Varianten ab der Anzeigegröße (für hochauflösende Displays)."""
+    return ", ".join(
+        f"{image['url']} {image['width']}w"
+        for image in sorted(images or [], key=lambda image: image.get('width') or 0)
+        if image.get('width') and image['width'] >= cover_display_size
+    )
 
-    MIN_SAT_FALLBACK = 0.2
+def extract_cover_palette(image_bytes):
+    """
+    Verkleinert das Cover und reduziert es auf bis zu 64 Farben.
+    Gibt die Palette als (n, 3)-Array mit RGB-Werten (0-255) zurück.
+    """
+    with metrics.timer('music_quiz_cover_quantize_seconds'), span('cover quantize'), Image.open(BytesIO(image_bytes)) as img:
+        # JPEGs gleich beim Dekodieren verkleinern (Draft-Modus), dann auf 64px bringen
+        img.draft('RGB', (64, 64))
+        img.thumbnail((64, 64))
+        paletted_img = img.convert("RGB").quantize(colors=64)
+        palette = paletted_img.getpalette()
+    # Die Palette ist eine flache Liste [R1,G1,B1, R2,G2,B2, ...]
+    return np.asarray(palette, dtype=np.float64).reshape(-1, 3)
+
+def pick_highlight_colors(palettes):
+    """
+    Wählt für viele Cover-Paletten in einem Durchgang die Akzentfarbe.
+    Bevorzugt wird die Farbe mit dem höchsten Produkt aus Sättigung und Helligkeit
+    (ab MIN_SATURATION/MIN_VALUE), sonst die hellste Farbe. None für leere Paletten.
+    """
+    if not palettes:
+        return []
+    width = max(len(p) for p in palettes)
+    rgb = np.zeros((len(palettes), width, 3))
+    valid = np.zeros((len(palettes), width), dtype=bool)
+    for i, p in enumerate(palettes):
+        rgb[i, :len(p)] = p
+        valid[i, :len(p)] = True
+
+    # HSV wie colorsys.rgb_to_hsv, nur Sättigung und Helligkeit werden gebraucht
+    scaled = rgb / 255.0
+    maxc = scaled.max(axis=2)
+    minc = scaled.min(axis=2)
+    saturation = np.divide(maxc - minc, maxc, out=np.zeros_like(maxc), where=maxc > minc)
+    value = maxc
+
+    ideal = valid & (saturation >= MIN_SATURATION) & (value >= MIN_VALUE)
+    score = np.where(ideal, saturation * value, -np.inf)
+    luminance = np.where(valid, 0.299 * rgb[..., 0] + 0.587 * rgb[..., 1] + 0.114 * rgb[..., 2], -np.inf)
+
+    # argmax liefert bei Gleichstand den ersten Treffer, wie zuvor sorted()/max()
+    best = np.where(ideal.any(axis=1), score.argmax(axis=1), luminance.argmax(axis=1))
+    chosen = rgb[np.arange(len(palettes)), best].astype(int)
+    return [
+        "#%02x%02x%02x" % tuple(chosen[i]) if valid[i].any() else None
+        for i in range(len(palettes))
+    ]
+
+def palette_for_highlight(highlight_color):
+    if not highlight_color:
+        return None
+    return {
+        'name': 'Album-Cover',
+        'highlight_color': highlight_color,
+        'button_hover_color': darken_color(highlight_color),
+        'button_text_color': get_text_color_for_bg(highlight_color)
+    }
 
-    
+def _download_cover_palette(image_url):
     try:
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-
-        with Image.open(BytesIO(response.content)) as img:
-            # 1. Bild extrem verkleinern für massive Performance-Steigerung
-            img.thumbnail((64, 64))
-
-            # 2. Schnelle Extraktion einer kleinen Farbpalette (8 Farben)
-            paletted_img = img.convert("RGB").quantize(colors=64)
-            palette = paletted_img.getpalette()
+        with metrics.timer('music_quiz_cover_download_seconds'), span('cover download'):
+            response = http_session.get(image_url, timeout=COVER_TIMEOUT)
+            response.raise_for_status()
+        return extract_cover_palette(response.content)
+    except Exception as e:
+        print(f"Fehler bei der Farbanalyse: {e}")
+        return None
 
-            # Die Palette ist eine flache Liste [R1,G1,B1, R2,G2,B2, ...], wir gruppieren sie
-            raw_colors_rgb = [tuple(palette[i:i+3]) for i in range(0, len(palette), 3)]
+def analyze_album_arts(image_urls):
+    """
+    Batch-Variante: lädt mehrere Cover und bewertet ihre Paletten gemeinsam.
+    Gibt pro URL eine Palette zurück, oder None, wenn das Cover nicht analysiert werden konnte.
+    """
+    palettes = [_download_cover_palette(url) for url in image_urls]
+    loaded = [i for i, p in enumerate(palettes) if p is not None]
+    results = [None] * len(image_urls)
+    for i, highlight_color in zip(loaded, pick_highlight_colors([palettes[i] for i in loaded])):
+        results[i] = palette_for_highlight(highlight_color)
+    return results
 
-        candidate_colors = []
+def analyze_album_art(image_url):
+    """
+    Analysiert ein Album-Cover mit einer mehrstufigen Logik,
+    um eine ästhetisch ansprechende Akzentfarbe zu finden.
+    Gibt None zurück, wenn das Cover nicht analysiert werden konnte.
+    """
+    return analyze_album_arts([image_url])[0]
 
-        for r, g, b in raw_colors_rgb:
+palette_cache = SharedCache('album-palette', palette_cache_local_size,
+                            palette_cache_ttl_seconds, palette_cache_negative_ttl_seconds)
 
-            h, s, v = colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
+def get_album_palette(album_id, images):
+    """
+    Liefert die Album-Palette aus dem Cache (Schlüssel: Album-ID, sonst Bild-URL).
+    Nur beim ersten Aufruf pro Album wird das Cover geladen und analysiert,
+    und zwar in der kleinsten Variante, die für die Analyse reicht.
+    """
+    image = pick_cover_image(images, cover_analysis_size)
+    if not image:
+        return PALETTES['default']
+    key = album_id or image['url']
+    palette = palette_cache.get_or_compute(key, lambda: analyze_album_art(image['url']))
+    return palette or PALETTES['default']
+
+# --- COVER-PROXY MIT DATEI-CACHE ---
+
+COVER_SIZES = (64, 300, 640)  # Varianten, die Spotify für Album-Cover liefert
+
+album_images_cache = SharedCache('album-images', palette_cache_local_size, palette_cache_ttl_seconds)
+_cover_cache_lock = threading.Lock()
+
+def remember_album_images(album):
+    """Merkt sich die Cover-Varianten eines Albums, damit /cover ohne Spotify-Abfrage auskommt."""
+    if album.get('id') and album.get('images'):
+        album_images_cache.set(album['id'], album['images'])
+
+def cover_url(album, size):
+    """URL des Covers für die gewünschte Kantenlänge: über den Proxy oder direkt vom CDN."""
+    if cover_proxy and album.get('id'):
+        return url_for('cover', album_id=album['id'], size=size)
+    image = pick_cover_image(album.get('images'), size)
+    return image['url'] if image else None
+
+def cover_image_srcset(album):
+    if cover_proxy and album.get('id'):
+        sizes = {image['width'] for image in album.get('images') or [] if (image.get('width') or 0) >= cover_display_size}
+        return ", ".join(f"{url_for('cover', album_id=album['id'], size=size)} {size}w" for size in sorted(sizes))
+    return cover_srcset(album.get('images'))
+
+def album_images(sp, album_id):
+    """Cover-Varianten eines Albums, aus dem Cache oder per Spotify (ohne sp nur aus dem Cache)."""
+    if sp is None:
+        return album_images_cache.get(album_id, count=False)[1]
+    return album_images_cache.get_or_compute(album_id, lambda: (sp.album(album_id) or {}).get('images'))
+
+def _cover_cache_path(album_id, size):
+    return os.path.join(cover_cache_dir, f"{album_id}-{size}.jpg")
+
+def _prune_cover_cache():
+    """Hält den Datei-Cache unter cover_cache_max_mb; die am längsten ungenutzten Dateien gehen zuerst."""
+    with _cover_cache_lock:
+        entries = []
+        with os.scandir(cover_cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.jpg'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        limit = cover_cache_max_mb * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
 
-            # "Ideale" Kandidaten mit strengen Kriterien sammeln
-            if s >= MIN_SATURATION and v >= MIN_VALUE:
-                score = (s * 1) * (v * 1)
-                candidate_colors.append({'rgb': (r, g, b), 'score': score})
+def fetch_cover_file(sp, album_id, size):
+    """
+    Pfad der lokal zwischengespeicherten Cover-Datei. Lädt die passende Variante
+    beim ersten Zugriff vom Spotify-CDN. None, wenn das Album kein Cover hat.
+    """
+    path = _cover_cache_path(album_id, size)
+    try:
+        # Zugriffszeit fürs Aufräumen, höchstens einmal pro Stunde schreiben
+        if time.time() - os.path.getmtime(path) > 3600:
+            os.utime(path)
+        metrics.inc('music_quiz_cover_proxy_total', {'result': 'hit'})
+        return path
+    except FileNotFoundError:
+        pass
 
-        highlight_color = None
+    image = pick_cover_image(album_images(sp, album_id), size)
+    if not image:
+        return None
+    with metrics.timer('music_quiz_cover_download_seconds'), span('cover download'):
+        response = http_session.get(image['url'], timeout=COVER_TIMEOUT)
+        response.raise_for_status()
+    os.makedirs(cover_cache_dir, exist_ok=True)
+    # Erst vollständig schreiben, dann umbenennen: parallele Anfragen sehen nie eine halbe Datei
+    fd, tmp_path = tempfile.mkstemp(dir=cover_cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp_path, path)
+    metrics.inc('music_quiz_cover_proxy_total', {'result': 'miss'})
+    _prune_cover_cache()
+    return path
+
+# --- ENDE DES COVER-PROXYS ---
+
+# --- FUNKTIONEN FÜR DIE ORIGINALVERSION ---
+
+TERMS_TO_REMOVE = [
+    r"\s*-\s*\d{4}\s*Remastered.*", r"\s*-\s*Remastered.*",
+    r"\s*-\s*\d{4}\s*Remaster.*", r"\s*-\s*Remaster.*",
+    r"\(Remastered\)", r"\[Remastered\]",
+    r"\(Remaster\)", r"\[Remaster\]",
+    r"\s+-\s*Live.*", r"\(Live\)", r"\[Live\]",
+    r"\s*-\s*Edit.*", r"\(Edit\)",
+    r"\s*-\s*Single.*",  r"\(Single Version\)",
+    r"\s*-\s*Mono.*", r"\(Mono Version\)",
+    r"\s*-\s*Stereo.*", r"\(Stereo Version\)",
+    r"\s*-\s*Original.*", r"\(Original Version\)", r"\(Original\)",
+    r"\s*-\s*Radio.*", r"\(Radio Version\)", r"\(Radio\)"
+]
+
+# Einmal beim Import kompiliert: die Einzelmuster (für die exakte Reihenfolge)
+# und ein kombiniertes Muster, das schnell prüft, ob überhaupt etwas zu tun ist.
+_COMPILED_TERMS = [re.compile(pattern, re.IGNORECASE) for pattern in TERMS_TO_REMOVE]
+_ANY_TERM = re.compile("|".join(f"(?:{pattern})" for pattern in TERMS_TO_REMOVE), re.IGNORECASE)
+
+year_cache = SharedCache('original-year', year_cache_local_size,
+                         year_cache_ttl_seconds, year_cache_negative_ttl_seconds)
+
+def _cache_metrics():
+    for cache in (year_cache, palette_cache, playlist_cache, device_registry.devices):
+        for result, value in (('local_hit', cache.local_hits), ('redis_hit', cache.redis_hits), ('miss', cache.misses)):
+            yield ('music_quiz_cache_requests_total', {'cache': cache.namespace, 'result': result}), value
+
+metrics.register_collector(_cache_metrics)
+
+@lru_cache(maxsize=4096)
+def clean_track_name(track_name):
+    """Entfernt Zusätze wie 'Remastered', 'Live' oder 'Radio Edit' aus einem Titel."""
+    # Trifft kein Muster auf den Originaltitel, kann auch keines nach dem Entfernen
+    # anderer Zusätze treffen: das Ergebnis ist dann nur der gestrippte Titel.
+    if not _ANY_TERM.search(track_name):
+        return track_name.strip()
+    # Sonst die Muster einzeln in der bisherigen Reihenfolge anwenden, da eine
+    # Entfernung neue Treffer erzeugen kann (z.B. "Song (Remastered)- Live").
+    for pattern in _COMPILED_TERMS:
+        track_name = pattern.sub("", track_name).strip()
+    return track_name
+
+def clean_track_names(track_names):
+    """Batch-Variante für eine ganze Suchergebnisseite; doppelte Titel werden nur einmal bereinigt."""
+    cleaned = {name: clean_track_name(name) for name in set(track_names)}
+    return [cleaned[name] for name in track_names]
+
+def year_cache_key(cleaned_track_name, artist_names):
+    """Cache-Schlüssel aus normalisiertem Titel und der (sortierten) Menge der Interpreten."""
+    title = " ".join(cleaned_track_name.lower().split())
+    artists = ",".join(sorted({" ".join(name.lower().split()) for name in artist_names}))
+    return f"{title}|{artists}"
+
+def search_earliest_release(sp, cleaned_track_name, artists_string, original_artist_names):
+    """
+    Sucht über die Spotify-Suche die früheste Veröffentlichung desselben Titels.
+    Gibt {'year': ..., 'album_name': ...} zurück oder None, wenn nichts passt.
+    """
+    earliest = None
+    results = sp.search(q=f"track:{cleaned_track_name} artist:{artists_string}", type="track", limit=50)
+    with span('match search results'):
+        items = [result for result in results['tracks']['items'] if result and 'name' in result]
+        cleaned_names = clean_track_names([result['name'] for result in items])
+        for result, cleaned_result_track_name in zip(items, cleaned_names):
+            try:
+                if cleaned_track_name.lower() == cleaned_result_track_name.lower():
+                    result_artist_names = [artist["name"].lower() for artist in result["artists"]]
+                    if any(artist_name in result_artist_names for artist_name in original_artist_names):
+                        result_year = int(result['album']['release_date'].split('-')[0])
+                        if earliest is None or result_year < earliest['year']:
+                            earliest = {'year': result_year, 'album_name': result['album']['name']}
+            except (KeyError, ValueError):
+                continue
+    return earliest
+
+def search_earliest_by_isrc(sp, isrc):
+    """
+    Sucht alle Veröffentlichungen derselben Aufnahme (gleicher ISRC) und liefert die
+    früheste als {'year': ..., 'album_name': ...}, oder None, wenn die Suche nichts findet.
+    """
+    earliest = None
+    results = sp.search(q=f"isrc:{isrc}", type="track", limit=50)
+    for result in results['tracks']['items']:
+        try:
+            result_year = int(result['album']['release_date'].split('-')[0])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if earliest is None or result_year < earliest['year']:
+            earliest = {'year': result_year, 'album_name': result['album']['name']}
+    return earliest
+
+class ResolverStats:
+    """
+    Zählt pro Strategie der Originalversion-Suche Anfragen, Suchdauer und Ausgang:
+    'earlier' (ältere Version als das Album gefunden, zählt als Treffer), 'not_earlier'
+    (nur gleich alte oder jüngere Versionen, z.B. der ISRC eines Remasters) und 'empty'.
+    """
+    OUTCOMES = ('earlier', 'not_earlier', 'empty')
 
-        if candidate_colors:
-            best_candidate = sorted(candidate_colors, key=lambda x: x['score'], reverse=True)[0]
-            r, g, b = best_candidate['rgb']
-            highlight_color = f"#{r:02x}{g:02x}{b:02x}"
-        elif raw_colors_rgb:
-            brightest_color = max(raw_colors_rgb, key=lambda c: (0.299*c[0] + 0.587*c[1] + 0.114*c[2]))
-            r, g, b = brightest_color
-            highlight_color = f"#{r:02x}{g:02x}{b:02x}"
+    def __init__(self, strategies):
+        self._lock = threading.Lock()
+        self._counters = {name: dict({'lookups': 0, 'searches': 0, 'search_seconds': 0.0}, **dict.fromkeys(self.OUTCOMES, 0))
+                          for name in strategies}
 
-        if not highlight_color:
-            return PALETTES['default']
+    def timed(self, strategy, compute):
+        """Umhüllt eine Suche, damit nur echte API-Aufrufe (Cache-Misses) gemessen werden."""
+        def wrapper():
+            start = time.perf_counter()
+            try:
+                return compute()
+            finally:
+                with self._lock:
+                    self._counters[strategy]['searches'] += 1
+                    self._counters[strategy]['search_seconds'] += time.perf_counter() - start
+        return wrapper
+
+    def record(self, strategy, outcome):
+        with self._lock:
+            self._counters[strategy]['lookups'] += 1
+            self._counters[strategy][outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for name, c in self._counters.items():
+                result[name] = {
+                    'lookups': c['lookups'],
+                    **{outcome: c[outcome] for outcome in self.OUTCOMES},
+                    'hit_ratio': round(c['earlier'] / c['lookups'], 3) if c['lookups'] else None,
+                    'searches': c['searches'],
+                    'avg_search_ms': round(c['search_seconds'] / c['searches'] * 1000, 1) if c['searches'] else None,
+                }
+            return result
+
+resolver_stats = ResolverStats(['isrc', 'title'])
+
+def release_outcome(earliest, album_year):
+    """Ausgang einer Suche für resolver_stats, gemessen am Jahr des laufenden Albums."""
+    if earliest is None:
+        return 'empty'
+    return 'earlier' if earliest['year'] < album_year else 'not_earlier'
+
+def find_earliest_release(sp, track_item):
+    """
+    Liefert (cleaned_track_name, earliest) für einen Track. Bevorzugt wird die Suche
+    über den ISRC der Aufnahme. Sie zählt aber nur, wenn sie eine ältere Version als das
+    laufende Album findet: Remaster und manche Compilations haben einen eigenen ISRC, der
+    nur sich selbst findet. Sonst wird wie bisher über Titel und Interpreten gesucht.
+    earliest enthält zusätzlich die Strategie ('isrc' oder 'title'). Suchergebnisse
+    werden über den gemeinsamen Cache geteilt.
+    """
+    cleaned_track_name = clean_track_name(track_item["name"])
+    try:
+        album_year = int(track_item["album"]["release_date"].split('-')[0])
+    except (KeyError, TypeError, ValueError):
+        album_year = float('inf')  # Ohne Albumjahr ist jede gefundene Version älter
+
+    isrc = (track_item.get("external_ids") or {}).get("isrc")
+    if isrc:
+        isrc = isrc.strip().upper()
+        earliest = year_cache.get_or_compute(
+            f"isrc:{isrc}", resolver_stats.timed('isrc', lambda: search_earliest_by_isrc(sp, isrc))
+        )
+        outcome = release_outcome(earliest, album_year)
+        resolver_stats.record('isrc', outcome)
+        if outcome == 'earlier':
+            return cleaned_track_name, dict(earliest, strategy='isrc')
+
+    artist_names = [artist["name"] for artist in track_item["artists"]]
+    artists_string = ", ".join(artist_names)
+    original_artist_names = [name.lower() for name in artist_names]
+
+    key = year_cache_key(cleaned_track_name, artist_names)
+    earliest = year_cache.get_or_compute(
+        key, resolver_stats.timed('title', lambda: search_earliest_release(sp, cleaned_track_name, artists_string, original_artist_names))
+    )
+    resolver_stats.record('title', release_outcome(earliest, album_year))
+    if earliest is not None:
+        earliest = dict(earliest, strategy='title')
+    return cleaned_track_name, earliest
+
+### 🎨 TEMPLATES UND STATISCHE DATEIEN ###
+
+def css_variables(colors):
+    """Theme-Farben und Größen-Einstellungen als CSS-Variablen für base.html."""
+    return {
+        'highlight-color': colors['highlight_color'],
+        'button-hover-color': colors['button_hover_color'],
+        'button-text-color': colors['button_text_color'],
+        'arrow-size': arrow_size,
+        'arrow-thickness': arrow_thickness,
+        'progress-bar-thickness': progress_bar_thickness,
+        'progress-bar-hover-thickness': progress_bar_thickness + progress_bar_hover_increase_px,
+        'album-art-hover-scale': album_art_hover_scale,
+        'arrow-hover-scale': arrow_hover_scale,
+        'button-hover-scale': button_hover_scale,
+    }
 
-        return {
-            'name': 'Album-Cover',
-            'highlight_color': highlight_color,
-            'button_hover_color': darken_color(highlight_color),
-            'button_text_color': get_text_color_for_bg(highlight_color)
-        }
+_static_versions = {}  # filename -> (mtime, hash)
 
-    except Exception as e:
-        print(f"Fehler bei der Farbanalyse: {e}")
-        return PALETTES['default']
+@app.template_global()
+def static_url(filename):
+    """
+    URL einer statischen Datei mit Inhalts-Hash (?v=...). Ändert sich die Datei,
+    ändert sich die URL, daher dürfen Browser sie unbegrenzt cachen.
+    """
+    path = os.path.join(app.static_folder, filename)
+    mtime = os.path.getmtime(path)
+    cached = _static_versions.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.md5(f.read()).hexdigest()[:10])
+        _static_versions[filename] = cached
+    return url_for('static', filename=filename, v=cached[1])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_request_profile():
+    """
+    Profiling auf Wunsch (?profile=<ADMIN_TOKEN> oder Header X-Profile, dazu optional
+    cprofile=1 bzw. X-Profile-CProfile: 1) oder per Stichprobe (profile_sample_rate).
+    """
+    if request.endpoint in ('static', 'slow_requests_page'):
+        return
+    requested = is_admin(request.args.get('profile') or request.headers.get('X-Profile'))
+    if not requested and not (profile_sample_rate and random.random() < profile_sample_rate):
+        return
+    # Ohne Query-String: der enthält beim angeforderten Profiling das Admin-Token
+    profile = RequestProfile(request.method, request.path, request.endpoint or 'unmatched',
+                             'requested' if requested else 'sampled')
+    if requested and (request.args.get('cprofile') or request.headers.get('X-Profile-CProfile')):
+        profile.cprofile = cProfile.Profile()
+        profile.cprofile.enable()
+    g.request_profile_token = _request_profile.set(profile)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('music_quiz_http_request_duration_seconds', time.perf_counter() - started,
+                        {'route': route, 'method': request.method, 'status': str(response.status_code)})
+    return response
+
+@app.after_request
+def finish_profile(response):
+    profile = _request_profile.get()
+    if profile is not None:
+        total_ms = finish_request_profile(profile, response.status_code)
+        if profile.reason == 'requested':
+            # In den DevTools des Browsers sichtbar (Netzwerk -> Timing)
+            entries = [f'total;dur={total_ms}'] + [
+                f'{re.sub(r"[^0-9A-Za-z_-]", "_", name)};dur={ms}' for name, ms in profile.breakdown()
+            ]
+            response.headers['Server-Timing'] = ", ".join(entries)
+    return response
+
+@app.teardown_request
+def reset_profile(exc):
+    token = g.pop('request_profile_token', None)
+    if token is not None:
+        profile = _request_profile.get()
+        if profile is not None and profile.cprofile is not None:
+            profile.cprofile.disable()
+        _request_profile.reset(token)
+
+@app.after_request
+def cache_versioned_static(response):
+    """Versionierte statische Dateien ein Jahr cachen; ETag und 304 liefert Flask selbst."""
+    if request.endpoint == 'static' and request.args.get('v'):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
 
 ### 🧠 HELFER-FUNKTIONEN FÜR DIE AUTHENTIFIZIERUNG ###
 
-def create_spotify_oauth():
-    return SpotifyOAuth(
+def create_spotify_oauth(cache_handler=None):
+    sp_oauth = SpotifyOAuth(
         client_id=os.environ.get('CLIENT_ID'),
         client_secret=os.environ.get('CLIENT_SECRET'),
         redirect_uri=os.environ.get('REDIRECT_URI'),
         scope=scope,
-        cache_handler=FlaskSessionCacheHandler(session)
+        cache_handler=cache_handler or FlaskSessionCacheHandler(session),
+        requests_session=http_session,
+        requests_timeout=SPOTIFY_TIMEOUT
     )
+    if SPOTIFY_ACCOUNTS_URL:
+        sp_oauth.OAUTH_AUTHORIZE_URL = SPOTIFY_ACCOUNTS_URL.rstrip('/') + '/authorize'
+        sp_oauth.OAUTH_TOKEN_URL = SPOTIFY_ACCOUNTS_URL.rstrip('/') + '/api/token'
+    return sp_oauth
+
+class TokenStore:
+    """
+    Spotify-Tokens in Redis statt im Session-Cookie: Das Cookie enthält nur noch eine
+    zufällige Session-ID. Ein Refresh läuft pro Session nur einmal gleichzeitig (Redis-Lock),
+    und ein Hintergrund-Thread erneuert Tokens aktiver Sessions, bevor sie ablaufen.
+    """
+    EXPIRY_KEY = "music-quiz:token-expiry"  # Sorted Set: sid -> expires_at
+    ACTIVE_KEY = "music-quiz:token-active"  # Sorted Set: sid -> letzte Anfrage
+
+    def __init__(self):
+        self._renewer = None
+        self._lock = threading.Lock()
+
+    def _key(self, sid):
+        return f"music-quiz:token:{sid}"
+
+    def available(self):
+        return server_side_tokens and get_redis() is not None
+
+    def create(self, token_info):
+        sid = secrets.token_urlsafe(32)
+        self.save(sid, token_info, touch=True)
+        return sid
+
+    def save(self, sid, token_info, touch=False):
+        """touch=True verlängert die Session (Anfrage des Nutzers), sonst bleibt ihre TTL erhalten."""
+        r = get_redis()
+        with r.pipeline() as pipe:
+            if touch:
+                pipe.set(self._key(sid), json.dumps(token_info), ex=token_session_ttl_seconds)
+            else:
+                pipe.set(self._key(sid), json.dumps(token_info), keepttl=True, xx=True)
+            pipe.zadd(self.EXPIRY_KEY, {sid: token_info['expires_at']})
+            pipe.execute()
+
+    def load(self, sid, touch=False):
+        r = get_redis()
+        with r.pipeline() as pipe:
+            pipe.get(self._key(sid))
+            if touch:
+                pipe.expire(self._key(sid), token_session_ttl_seconds)
+                pipe.zadd(self.ACTIVE_KEY, {sid: int(time.time())})
+            raw = pipe.execute()[0]
+        if raw is None:
+            self._forget(sid)
+            return None
+        return json.loads(raw)
+
+    def delete(self, sid):
+        get_redis().delete(self._key(sid))
+        self._forget(sid)
+
+    def _forget(self, sid):
+        r = get_redis()
+        with r.pipeline() as pipe:
+            pipe.zrem(self.EXPIRY_KEY, sid)
+            pipe.zrem(self.ACTIVE_KEY, sid)
+            pipe.execute()
+
+    def get_valid(self, sid, min_valid_seconds=60, touch=False):
+        """Token, das noch mindestens min_valid_seconds gilt; sonst wird es (einmalig) erneuert."""
+        self.start_renewer()
+        token_info = self.load(sid, touch=touch)
+        if token_info and token_info['expires_at'] - int(time.time()) < min_valid_seconds:
+            token_info = self.refresh(sid, min_valid_seconds)
+        return token_info
+
+    def refresh(self, sid, min_valid_seconds):
+        """
+        Erneuert das Token der Session. Hält ein anderer Request oder Worker bereits den
+        Lock, wird auf dessen Ergebnis gewartet statt selbst die Accounts-API aufzurufen.
+        """
+        r = get_redis()
+        lock_key = self._key(sid) + ":refresh"
+        lock_token = uuid.uuid4().hex
+        if not r.set(lock_key, lock_token, nx=True, px=cache_lock_timeout_seconds * 1000):
+            deadline = time.time() + cache_lock_timeout_seconds
+            while time.time() < deadline and r.exists(lock_key):
+                time.sleep(0.05)
+            return self.load(sid)
+        try:
+            token_info = self.load(sid)
+            # Wurde währenddessen schon erneuert, reicht das aktuelle Token
+            if token_info is None or token_info['expires_at'] - int(time.time()) >= min_valid_seconds:
+                return token_info
+            sp_oauth = create_spotify_oauth(cache_handler=spotipy.cache_handler.MemoryCacheHandler())
+            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
+            self.save(sid, token_info)
+            return token_info
+        finally:
+            if r.get(lock_key) == lock_token.encode():
+                r.delete(lock_key)
+
+    def start_renewer(self):
+        if self._renewer is not None:
+            return
+        with self._lock:
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name="token-renewer", daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(token_renew_interval_seconds)
+            try:
+                r = get_redis()
+                now = int(time.time())
+                expiring = {sid.decode() for sid in r.zrangebyscore(self.EXPIRY_KEY, 0, now + token_renew_ahead_seconds)}
+                active = {sid.decode() for sid in r.zrangebyscore(self.ACTIVE_KEY, now - token_renew_idle_seconds, '+inf')}
+                for sid in expiring & active:
+                    try:
+                        self.refresh(sid, token_renew_ahead_seconds)
+                    except Exception as e:
+                        print(f"Token-Erneuerung im Hintergrund fehlgeschlagen: {e}")
+                r.zremrangebyscore(self.ACTIVE_KEY, 0, now - token_renew_idle_seconds)
+            except redis.RedisError as e:
+                print(f"Redis-Fehler bei der Token-Erneuerung: {e}")
+
+token_store = TokenStore()
+
+def store_token(token_info):
+    """Legt ein neues Token ab: serverseitig, wenn möglich, sonst wie bisher im Cookie."""
+    session.pop(TOKEN_INFO_KEY, None)
+    if token_store.available():
+        try:
+            session[TOKEN_SID_KEY] = token_store.create(token_info)
+            return
+        except redis.RedisError as e:
+            print(f"Token-Store nicht verfügbar, speichere im Cookie: {e}")
+    session[TOKEN_INFO_KEY] = token_info
 
 def get_token():
+    sid = session.get(TOKEN_SID_KEY)
+    if sid and token_store.available():
+        try:
+            token_info = token_store.get_valid(sid, touch=True)
+            if not token_info:
+                session.pop(TOKEN_SID_KEY, None)
+            return token_info
+        except redis.RedisError as e:
+            print(f"Token-Store nicht erreichbar: {e}")
+            return None
+
     token_info = session.get(TOKEN_INFO_KEY, None)
     if not token_info:
         return None
@@ -209,14 +1666,1029 @@ def get_token():
         token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
         session[TOKEN_INFO_KEY] = token_info
 
+    # Bestehende Cookie-Sessions wandern in den Token-Store, sobald Redis verfügbar ist
+    if token_store.available():
+        store_token(token_info)
+
     return token_info
 
+def get_active_token():
+    """Token des Kontos, das gerade spielt: in einem Raum das des Hosts, sonst das eigene."""
+    room = current_room()
+    if room is not None:
+        try:
+            return token_store.get_valid(room['token_sid'])
+        except redis.RedisError as e:
+            print(f"Token des Raums nicht erreichbar: {e}")
+            return None
+    return get_token()
+
 def get_spotify_client():
-    token_info = get_token()
+    token_info = get_active_token()
     if not token_info:
         return None
-    return spotipy.Spotify(auth=token_info['access_token'])
+    room = current_room()
+    account_key = room['host_user_id'] if room is not None else session.get('spotify_user_id')
+    return spotify_client_for(token_info['access_token'], account_key)
+
+def spotify_client_for(access_token, account_key=None):
+    """Spotify-Client auf der gemeinsamen Session; das Anlegen kostet keine neue Verbindung."""
+    return GatedSpotify(auth=access_token, requests_session=http_session, requests_timeout=SPOTIFY_TIMEOUT,
+                        account_key=account_key)
+
+def get_spotify_user_id(sp):
+    """Spotify-ID des angemeldeten Kontos (im Raum: des Hosts), einmal pro Session abgefragt."""
+    room = current_room()
+    if room is not None:
+        return room['host_user_id']
+    user_id = session.get('spotify_user_id')
+    if not user_id:
+        user_id = sp.current_user()['id']
+        session['spotify_user_id'] = user_id
+        if isinstance(sp, GatedSpotify):
+            sp.account_key = user_id
+    return user_id
+
+### ⏱️ PLAYBACK-SNAPSHOTS ###
+
+class PlaybackSnapshots:
+    """
+    Teilt currently_playing-Ergebnisse pro Konto: Gleichzeitige Anfragen warten auf
+    denselben Spotify-Aufruf, und für playback_snapshot_ttl_ms wird das Ergebnis
+    wiederverwendet. Eigene Steuerbefehle verwerfen den Snapshot sofort.
+    """
+    def __init__(self):
+        self._snapshots = {}   # user_id -> (fetched_at, value)
+        self._inflight = {}    # user_id -> laufender Aufruf (dict mit Event und Ergebnis)
+        self._generation = {}  # user_id -> Zähler, wird bei invalidate() erhöht
+        self._lock = threading.Lock()
+
+    def get(self, user_id, fetch):
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot and (time.monotonic() - snapshot[0]) * 1000 < playback_snapshot_ttl_ms:
+                return snapshot[1]
+            call = self._inflight.get(user_id)
+            is_leader = call is None
+            if is_leader:
+                call = {'event': threading.Event(), 'generation': self._generation.get(user_id, 0)}
+                self._inflight[user_id] = call
+
+        if not is_leader:
+            call['event'].wait(cache_lock_timeout_seconds)
+            if 'error' in call:
+                raise call['error']
+            if 'value' in call:
+                return call['value']
+            return fetch()
+
+        try:
+            call['value'] = fetch()
+            with self._lock:
+                # Wurde währenddessen invalidiert, ist das Ergebnis womöglich schon veraltet
+                if self._generation.get(user_id, 0) == call['generation']:
+                    self._snapshots[user_id] = (time.monotonic(), call['value'])
+            return call['value']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(user_id) is call:
+                    del self._inflight[user_id]
+            call['event'].set()
+
+    def invalidate(self, user_id):
+        """Verwirft den Snapshot und gibt die neue Generation zurück."""
+        with self._lock:
+            self._snapshots.pop(user_id, None)
+            self._inflight.pop(user_id, None)
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+            return self._generation[user_id]
+
+    def put(self, user_id, value, generation):
+        """Legt einen bereits bekannten Zustand ab, sofern seitdem nicht erneut invalidiert wurde."""
+        with self._lock:
+            if self._generation.get(user_id, 0) == generation:
+                self._snapshots[user_id] = (time.monotonic(), value)
+
+playback_snapshots = PlaybackSnapshots()
+
+def get_current_playback(sp):
+    """currently_playing über den gemeinsamen Snapshot des angemeldeten Kontos."""
+    return playback_snapshots.get(get_spotify_user_id(sp), sp.currently_playing)
+
+### ⏩ STEUERBEFEHLE MIT BESTÄTIGUNG ###
+
+def playing_track_id(current_track):
+    return current_track['item']['id'] if current_track and current_track.get('item') else None
+
+def confirm_playback(sp, user_id, generation, is_confirmed, superseded=lambda: False):
+    """
+    Fragt nach einem Steuerbefehl den Wiedergabestatus ab, bis is_confirmed() zutrifft
+    oder die Frist abläuft; die Abstände verdoppeln sich dabei bis zum Höchstwert. Der
+    letzte Zustand landet im Playback-Snapshot und wird an alle offenen Tabs verteilt.
+    Meldet superseded() einen neueren Befehl, wird ohne Ergebnis abgebrochen.
+    """
+    deadline = time.monotonic() + command_confirm_timeout_seconds
+    interval = command_confirm_interval_seconds
+    while True:
+        try:
+            current_track = sp.currently_playing()
+        except Exception as e:
+            print(f"Status nach Steuerbefehl nicht abrufbar: {e}")
+            return None
+        if is_confirmed(current_track) or time.monotonic() >= deadline:
+            break
+        time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        interval = min(interval * 2, command_confirm_max_interval_seconds)
+        if superseded():
+            return None
+    playback_snapshots.put(user_id, current_track, generation)
+    track_events.publish(user_id, track_event(current_track))
+    return current_track
+
+_confirm_jobs = {}              # user_id -> neuester Bestätigungsauftrag
+_confirmers = {}                # user_id -> threading.Thread
+_confirmers_lock = threading.Lock()
+
+def queue_playback_confirmation(sp, user_id, generation, is_confirmed):
+    """
+    Ein Bestätigungs-Thread pro Konto statt einem pro Klick: Ein neuer Befehl ersetzt
+    den wartenden Auftrag, ein gerade laufender bricht bei der nächsten Abfrage ab.
+    """
+    with _confirmers_lock:
+        _confirm_jobs[user_id] = (sp, generation, is_confirmed)
+        confirmer = _confirmers.get(user_id)
+        if confirmer is not None and confirmer.is_alive():
+            return
+        confirmer = threading.Thread(target=_confirmer_loop, args=(user_id,), name=f"confirm-playback-{user_id}", daemon=True)
+        _confirmers[user_id] = confirmer
+        confirmer.start()
+
+def _confirmer_loop(user_id):
+    while True:
+        with _confirmers_lock:
+            job = _confirm_jobs.pop(user_id, None)
+            if job is None:
+                del _confirmers[user_id]
+                return
+        sp, generation, is_confirmed = job
+        confirm_playback(sp, user_id, generation, is_confirmed, superseded=lambda: user_id in _confirm_jobs)
+
+def confirms_in_background():
+    """Nur fetch()-Aufrufe der Quiz-Seite hören auf /events; Links warten auf die Bestätigung."""
+    return live_updates() and wants_json()
+
+def await_playback_command(sp, is_confirmed):
+    """
+    Statt einer festen Pause: Bei fetch()-Aufrufen mit Live-Updates geht die Antwort
+    sofort raus und die Tabs erhalten den neuen Zustand per Event, sonst wird bis zur
+    Bestätigung gewartet.
+    """
+    try:
+        user_id = get_spotify_user_id(sp)
+    except Exception as e:
+        print(f"Steuerbefehl kann nicht bestätigt werden: {e}")
+        return
+    generation = playback_snapshots.invalidate(user_id)
+    if confirms_in_background():
+        queue_playback_confirmation(sp, user_id, generation, is_confirmed)
+    else:
+        confirm_playback(sp, user_id, generation, is_confirmed)
+
+### 🔊 GERÄTE ###
+
+class DeviceRegistry:
+    """
+    Spotify-Geräte pro Konto: eine kurzlebige Geräteliste und das zuletzt erfolgreich
+    genutzte Gerät, beides über den gemeinsamen Cache. Ist nach einer Pause kein Gerät
+    aktiv, reicht so meist ein einziges transfer_playback.
+    """
+    def __init__(self):
+        self.devices = SharedCache('devices', 256, device_cache_ttl_seconds)
+        self.last_good = SharedCache('last-device', 256, last_device_ttl_seconds)
+
+    def refresh(self, sp, user_id):
+        devices = (sp.devices() or {}).get('devices') or []
+        self.devices.set(user_id, devices)
+        active = next((d for d in devices if d.get('is_active') and d.get('id')), None)
+        if active:
+            self.remember(user_id, active['id'])
+        return devices
+
+    def refresh_if_stale(self, sp, user_id):
+        if not self.devices.get(user_id, count=False)[0]:
+            self.refresh(sp, user_id)
+
+    def remember(self, user_id, device_id):
+        self.last_good.set(user_id, device_id)
+
+    def candidates(self, user_id):
+        """Geräte-IDs in Versuchsreihenfolge, ohne API-Aufruf: zuerst das zuletzt genutzte."""
+        hit, devices = self.devices.get(user_id, count=False)
+        usable = [d for d in devices or [] if d.get('id') and not d.get('is_restricted')]
+        ordered = [d['id'] for d in sorted(usable, key=lambda d: device_priorities.get(d.get('type'), 99))]
+        _, last = self.last_good.get(user_id, count=False)
+        # Fehlt das Gerät in einer aktuellen Liste, ist es offline
+        if last and (not hit or last in ordered):
+            ordered = [last] + [device_id for device_id in ordered if device_id != last]
+        return ordered
+
+device_registry = DeviceRegistry()
+
+def activate_device(sp, user_id):
+    """
+    Startet die Wiedergabe, wenn kein Gerät aktiv ist. Zuerst auf dem Gerät aus dem Cache,
+    erst wenn das scheitert mit frischer Geräteliste. Gibt die Geräte-ID zurück oder None.
+    """
+    tried = None
+    candidates = device_registry.candidates(user_id)
+    if candidates:
+        tried = candidates[0]
+        try:
+            sp.transfer_playback(tried, force_play=True)
+            device_registry.remember(user_id, tried)
+            return tried
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Gerät {tried} nicht erreichbar, lade Geräteliste neu: {e}")
+
+    device_registry.refresh(sp, user_id)
+    for device_id in device_registry.candidates(user_id):
+        if device_id != tried:
+            sp.transfer_playback(device_id, force_play=True)
+            device_registry.remember(user_id, device_id)
+            return device_id
+    return None
+
+def resume_on_device(sp):
+    """Wiedergabe auf einem bekannten Gerät fortsetzen, wenn keines aktiv ist."""
+    device_id = activate_device(sp, get_spotify_user_id(sp))
+    if device_id:
+        print(f"Playback transferred to device {device_id}.")
+        await_playback_command(sp, lambda t: bool(t and t.get('is_playing')))
+    else:
+        print("No available devices found for user.")
+
+### 🔮 VORBERECHNUNG DER WARTESCHLANGE ###
+
+_enrichment_jobs = queue.Queue(maxsize=64)
+_enrichment_threads = []
+_enrichment_lock = threading.Lock()
+_enrichment_inflight = set()  # "user_id:track_id" in Arbeit oder wartend auf Wiederholung
+# Erst nach erfolgreicher Vorberechnung gesetzt; der LRU begrenzt den Prozess, Redis teilt es mit allen Workern
+enriched_tracks = SharedCache('enriched', 1024, 3600)
+
+def schedule_queue_enrichment(sp, user_id, current_track_id, upcoming=None):
+    """
+    Stößt nach einem Trackwechsel die Vorberechnung der nächsten Tracks an.
+    Pro Konto und Track passiert das nur einmal, auch über mehrere Worker hinweg.
+    Sind die nächsten Tracks schon bekannt (Deck), entfällt die Abfrage der Warteschlange.
+    """
+    if not queue_enrichment or not user_id or not current_track_id:
+        return
+    job_key = f"{user_id}:{current_track_id}"
+    if enriched_tracks.get(job_key, count=False)[0]:
+        return
+    with _enrichment_lock:
+        if job_key in _enrichment_inflight:
+            return
+        _enrichment_inflight.add(job_key)
+    r = get_redis()
+    if r is not None:
+        try:
+            # Nur eine Sperre gegen parallele Worker; sie fällt bei Misserfolg wieder weg
+            if not r.set(f"music-quiz:enriching:{job_key}", 1, nx=True, ex=300):
+                with _enrichment_lock:
+                    _enrichment_inflight.discard(job_key)
+                return
+        except redis.RedisError as e:
+            print(f"Redis-Fehler bei der Vorberechnung: {e}")
+    _start_enrichment_threads()
+    _enqueue_enrichment((sp, job_key, upcoming, 0))
+
+def _enqueue_enrichment(job):
+    try:
+        _enrichment_jobs.put_nowait(job)
+    except queue.Full:
+        print("Vorberechnung übersprungen: Warteschlange voll")
+        _finish_enrichment(job[1])
+
+def _finish_enrichment(job_key):
+    with _enrichment_lock:
+        _enrichment_inflight.discard(job_key)
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(f"music-quiz:enriching:{job_key}")
+        except redis.RedisError as e:
+            print(f"Redis-Fehler bei der Vorberechnung: {e}")
+
+def _start_enrichment_threads():
+    if _enrichment_threads:
+        return
+    with _enrichment_lock:
+        while len(_enrichment_threads) < queue_enrichment_workers:
+            thread = threading.Thread(target=_enrichment_loop, name=f"queue-enrichment-{len(_enrichment_threads)}", daemon=True)
+            _enrichment_threads.append(thread)
+            thread.start()
+
+def _enrichment_loop():
+    while True:
+        sp, job_key, upcoming, attempt = _enrichment_jobs.get()
+        try:
+            with spotify_priority(PRIORITY_BACKGROUND):
+                if upcoming is None:
+                    enrich_upcoming_tracks(sp)
+                else:
+                    enrich_tracks(sp, upcoming)
+            enriched_tracks.set(job_key, True)
+        except SpotifyRateLimited as e:
+            # Hintergrundaufrufe lehnt das Gateway bei knappem Bucket sofort ab, etwa direkt nach dem Login
+            if attempt < queue_enrichment_retries:
+                delay = max(e.retry_after, queue_enrichment_retry_seconds * 2 ** attempt)
+                retry = threading.Timer(delay, _enqueue_enrichment, args=((sp, job_key, upcoming, attempt + 1),))
+                retry.daemon = True
+                retry.start()
+                continue
+            print(f"Vorberechnung nach {attempt + 1} Versuchen aufgegeben: {e}")
+        except Exception as e:
+            print(f"Fehler bei der Vorberechnung der Warteschlange: {e}")
+        _finish_enrichment(job_key)
+
+def enrich_upcoming_tracks(sp):
+    """
+    Füllt year_cache und palette_cache für die nächsten Tracks der Warteschlange,
+    sodass das Auflösen dieser Tracks weder eine Suche noch eine Farbanalyse braucht.
+    """
+    upcoming = (sp.queue() or {}).get('queue') or []
+    # Podcast-Folgen haben weder Album noch Interpreten
+    tracks = [item for item in upcoming if item and item.get('type', 'track') == 'track' and item.get('album')]
+    enrich_tracks(sp, tracks[:queue_enrichment_depth])
+
+def enrich_tracks(sp, tracks):
+    """Originalversion und Album-Palette für die übergebenen Track-Objekte vorberechnen."""
+    for item in tracks:
+        find_earliest_release(sp, item)
+
+    # Noch nicht analysierte Cover gemeinsam auswerten; Schlüssel wie in get_album_palette()
+    pending = {}
+    for item in tracks:
+        image = pick_cover_image(item['album'].get('images'), cover_analysis_size)
+        if not image:
+            continue
+        key = item['album'].get('id') or image['url']
+        if key not in pending and not palette_cache.get(key, count=False)[0]:
+            pending[key] = image['url']
+    keys = list(pending)
+    for key, palette in zip(keys, analyze_album_arts([pending[key] for key in keys])):
+        palette_cache.set(key, palette)
+
+### 📡 LIVE-UPDATES (SERVER-SENT EVENTS) ###
+
+def track_event(current_track):
+    """Kompakter Zustand für die Tabs: nur, was sie zum Erkennen eines Wechsels brauchen."""
+    item = current_track.get('item') if current_track else None
+    return {
+        'track_id': item['id'] if item else None,
+        'is_playing': bool(current_track and current_track.get('is_playing')),
+        'progress_ms': current_track.get('progress_ms', 0) if current_track else 0,
+        'duration_ms': item.get('duration_ms', 0) if item else 0,
+    }
+
+class TrackEventHub:
+    """
+    Verteilt Track-Wechsel an alle offenen Tabs eines Spotify-Kontos. Mit Redis
+    laufen die Events über Pub/Sub, sodass jeder Gunicorn-Worker sie erhält,
+    egal welcher Worker den Watcher des Kontos betreibt.
+    """
+    CHANNEL_PREFIX = "music-quiz:events:"
+
+    def __init__(self):
+        self._subscribers = {}  # user_id -> set(queue.Queue)
+        self._last_state = {}   # user_id -> (timestamp, event)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, user_id, q=None):
+        """Neue Queue für einen Tab; mit q wird eine bestehende zusätzlich für diesen Kanal angemeldet."""
+        if q is None:
+            q = queue.Queue(maxsize=16)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(q)
+        self._ensure_redis_listener()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self, user_id):
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+    def set_state(self, user_id, event):
+        """Merkt sich den zuletzt gesehenen Zustand, damit neue Tabs ihn sofort bekommen."""
+        with self._lock:
+            self._last_state[user_id] = (time.time(), event)
+        r = get_redis()
+        if r is not None:
+            try:
+                r.set(f"music-quiz:last-track:{user_id}", json.dumps(event), ex=max(1, int(polling_interval_seconds * 2)))
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Speichern des Track-Zustands: {e}")
+
+    def last_state(self, user_id):
+        """Nur ein frischer Zustand (jünger als zwei Poll-Intervalle) wird zurückgegeben."""
+        r = get_redis()
+        if r is not None:
+            try:
+                raw = r.get(f"music-quiz:last-track:{user_id}")
+                return json.loads(raw) if raw else None
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Lesen des Track-Zustands: {e}")
+        with self._lock:
+            entry = self._last_state.get(user_id)
+        if entry and time.time() - entry[0] < polling_interval_seconds * 2:
+            return entry[1]
+        return None
+
+    def publish(self, user_id, event):
+        r = get_redis()
+        if r is not None:
+            try:
+                r.publish(self.CHANNEL_PREFIX + user_id, json.dumps(event))
+                return
+            except redis.RedisError as e:
+                print(f"Redis-Fehler beim Veröffentlichen, verteile nur lokal: {e}")
+        self._dispatch(user_id, event)
+
+    def _dispatch(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass  # Tab hängt hinterher; das nächste Event bringt ihn wieder auf Stand
+
+    def _ensure_redis_listener(self):
+        if self._listener is not None or get_redis() is None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen_redis, name="track-event-listener", daemon=True)
+            self._listener.start()
+
+    def _listen_redis(self):
+        while True:
+            try:
+                # Eigene Verbindung ohne Socket-Timeout, da Pub/Sub lange still sein kann
+                pubsub = redis.Redis.from_url(REDIS_URL, health_check_interval=30).pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.CHANNEL_PREFIX + "*")
+                for message in pubsub.listen():
+                    channel = message['channel'].decode()
+                    self._dispatch(channel[len(self.CHANNEL_PREFIX):], json.loads(message['data']))
+            except redis.RedisError as e:
+                print(f"Redis-Pub/Sub unterbrochen, verbinde neu: {e}")
+                time.sleep(1)
+
+track_events = TrackEventHub()
+
+_WATCHER_ID = uuid.uuid4().hex  # Kennung dieses Prozesses für die Watcher-Lease
+_account_tokens = {}            # user_id -> token_info für die Hintergrund-Watcher
+_account_token_sids = {}        # user_id -> Session-ID im Token-Store (falls aktiv)
+_watchers = {}                  # user_id -> threading.Thread
+_watchers_lock = threading.Lock()
+_watch_wanted_until = {}        # user_id -> Zeitpunkt, bis zu dem der Watcher ohne Redis noch gebraucht wird
+
+def ensure_track_watcher(user_id, token_info, token_sid=None):
+    """
+    Sorgt dafür, dass für das Konto ein Watcher läuft. Pro Prozess gibt es höchstens
+    einen Thread je Konto; über eine Redis-Lease pollt davon nur einer Spotify.
+    """
+    _account_tokens[user_id] = token_info
+    if token_sid:
+        _account_token_sids[user_id] = token_sid
+    _watch_wanted_until[user_id] = time.time() + watcher_linger_seconds
+    r = get_redis()
+    if r is not None:
+        try:
+            r.set(f"music-quiz:watch-wanted:{user_id}", 1, ex=watcher_linger_seconds)
+        except redis.RedisError as e:
+            print(f"Redis-Fehler beim Anmelden des Watchers: {e}")
+    with _watchers_lock:
+        watcher = _watchers.get(user_id)
+        if watcher is not None and watcher.is_alive():
+            return
+        watcher = threading.Thread(target=_track_watcher_loop, args=(user_id,), name=f"track-watcher-{user_id}", daemon=True)
+        _watchers[user_id] = watcher
+        watcher.start()
+
+def _is_watch_wanted(user_id):
+    if track_events.subscriber_count(user_id) > 0:
+        _watch_wanted_until[user_id] = time.time() + watcher_linger_seconds
+        return True
+    r = get_redis()
+    if r is not None:
+        try:
+            return bool(r.exists(f"music-quiz:watch-wanted:{user_id}"))
+        except redis.RedisError:
+            pass
+    return time.time() < _watch_wanted_until.get(user_id, 0)
+
+def _acquire_watcher_lease(user_id):
+    """True, wenn dieser Prozess den Watcher für das Konto betreiben soll."""
+    r = get_redis()
+    if r is None:
+        return True
+    lease_key = f"music-quiz:watcher:{user_id}"
+    lease_ms = int(polling_interval_seconds * 3000)
+    try:
+        if r.set(lease_key, _WATCHER_ID, nx=True, px=lease_ms):
+            return True
+        if r.get(lease_key) == _WATCHER_ID.encode():
+            r.pexpire(lease_key, lease_ms)
+            return True
+        return False
+    except redis.RedisError as e:
+        print(f"Redis-Fehler bei der Watcher-Lease: {e}")
+        return True
+
+def _watcher_token(user_id):
+    """Token für den Hintergrund-Watcher; läuft er bald ab, wird er hier erneuert."""
+    sid = _account_token_sids.get(user_id)
+    if sid and token_store.available():
+        token_info = token_store.get_valid(sid)
+        if token_info:
+            _account_tokens[user_id] = token_info
+            return token_info
+    token_info = _account_tokens.get(user_id)
+    if token_info and token_info['expires_at'] - int(time.time()) < 60:
+        sp_oauth = create_spotify_oauth(cache_handler=spotipy.cache_handler.MemoryCacheHandler())
+        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
+        _account_tokens[user_id] = token_info
+    return token_info
+
+def _track_watcher_loop(user_id):
+    last_seen = None
+    try:
+        while _is_watch_wanted(user_id):
+            if _acquire_watcher_lease(user_id):
+                try:
+                    token_info = _watcher_token(user_id)
+                    if token_info:
+                        watcher_sp = spotify_client_for(token_info['access_token'], user_id)
+                        current_track = playback_snapshots.get(user_id, watcher_sp.currently_playing)
+                        event = track_event(current_track)
+                        track_events.set_state(user_id, event)
+                        if (event['track_id'], event['is_playing']) != last_seen:
+                            last_seen = (event['track_id'], event['is_playing'])
+                            track_events.publish(user_id, event)
+                            schedule_queue_enrichment(watcher_sp, user_id, event['track_id'])
+                        # Geräteliste warm halten, damit Play nach einer Pause ohne devices()-Aufruf auskommt
+                        with spotify_priority(PRIORITY_BACKGROUND):
+                            device_registry.refresh_if_stale(watcher_sp, user_id)
+                except Exception as e:
+                    print(f"Fehler im Track-Watcher für {user_id}: {e}")
+            time.sleep(polling_interval_seconds)
+    finally:
+        with _watchers_lock:
+            if _watchers.get(user_id) is threading.current_thread():
+                del _watchers[user_id]
+
+
+### 👥 RÄUME (MULTIPLAYER) ###
+
+ROOM_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # Ohne leicht verwechselbare Zeichen
+
+def room_channel(code):
+    """Kanal im TrackEventHub, über den Zustandsänderungen eines Raums verteilt werden."""
+    return f"room:{code}"
+
+class RoomStore:
+    """
+    Quiz-Räume in Redis: Das Spotify-Konto des Hosts steuert den Raum, Gäste treten
+    per Code bei und brauchen kein eigenes Login. quiz_state, player_mode und theme
+    liegen im Raum statt im Session-Cookie; Änderungen gehen per Pub/Sub an alle
+    Bildschirme, egal auf welchem Worker. Gepollt wird Spotify nur vom Watcher des Hosts.
+    """
+    def _key(self, code):
+        return f"music-quiz:room:{code}"
+
+    def available(self):
+        # Gäste auf anderen Workern brauchen das Token des Hosts aus dem Token-Store
+        return token_store.available()
+
+    def create(self, host_user_id, token_sid, state):
+        r = get_redis()
+        for _ in range(10):
+            code = "".join(secrets.choice(ROOM_CODE_ALPHABET) for _ in range(room_code_length))
+            room = dict(state, code=code, host_user_id=host_user_id, token_sid=token_sid, version=0)
+            if r.set(self._key(code), json.dumps(room), nx=True, ex=room_ttl_seconds):
+                return room
+        raise RuntimeError("Kein freier Raumcode gefunden.")
+
+    def load(self, code):
+        raw = get_redis().get(self._key(code))
+        return json.loads(raw) if raw else None
+
+    def update(self, code, changes, notify=True):
+        """
+        Ändert den Raum atomar (WATCH/MULTI). changes ist ein dict oder eine Funktion,
+        die aus dem aktuellen Raum die Änderungen berechnet; ein leeres dict ändert nichts.
+        Gibt den neuen Raum zurück, oder None, wenn er nicht mehr existiert.
+        """
+        key = self._key(code)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            if raw is None:
+                return None, False
+            room = json.loads(raw)
+            delta = changes(room) if callable(changes) else changes
+            if not delta:
+                return room, False
+            room.update(delta)
+            room['version'] += 1
+            pipe.multi()
+            pipe.set(key, json.dumps(room), ex=room_ttl_seconds)
+            return room, True
+
+        room, changed = get_redis().transaction(apply, key, value_from_callable=True)
+        if changed and notify:
+            track_events.publish(room_channel(code), {'room': code, 'version': room['version']})
+        return room
+
+    def close(self, code):
+        get_redis().delete(self._key(code))
+        track_events.publish(room_channel(code), {'room': code, 'closed': True})
+
+room_store = RoomStore()
+
+def current_room():
+    """Raum dieser Session (einmal pro Request aus Redis geladen) oder None."""
+    code = session.get('room_code')
+    if not code or not room_store.available():
+        return None
+    if 'room' not in g:
+        try:
+            g.room = room_store.load(code)
+        except redis.RedisError as e:
+            print(f"Raum {code} nicht erreichbar: {e}")
+            return None
+        if g.room is None:
+            # Raum wurde geschlossen oder ist abgelaufen
+            session.pop('room_code', None)
+            session.pop('room_host', None)
+    return g.room
+
+def get_quiz_setting(name, default=None):
+    """quiz_state, player_mode oder theme: aus dem Raum, sonst aus der Session."""
+    room = current_room()
+    value = room.get(name) if room is not None else session.get(name)
+    return default if value is None else value
+
+def set_quiz_setting(name, value, notify=True):
+    """Setzt eine Einstellung im Raum (und benachrichtigt alle Bildschirme) bzw. in der Session; None löscht sie."""
+    room = current_room()
+    if room is not None:
+        g.room = room_store.update(room['code'], {name: value}, notify=notify)
+    elif value is None:
+        session.pop(name, None)
+    else:
+        session[name] = value
+
+def start_quiz_round(track_id):
+    """Neuer Track: Rätsel zurücksetzen. Im Raum nur, wenn kein anderer Bildschirm es schon getan hat."""
+    quiz_state = {'track_id': track_id, 'is_solved': False, 'round_id': secrets.token_hex(4)}
+    room = current_room()
+    if room is None:
+        session['quiz_state'] = quiz_state
+        return quiz_state
+
+    def reset(room):
+        if (room.get('quiz_state') or {}).get('track_id') == track_id:
+            return {}
+        return {'quiz_state': quiz_state}
+
+    g.room = room_store.update(room['code'], reset, notify=False)
+    return (g.room or {}).get('quiz_state') or quiz_state
+
+def can_control_playback():
+    """Im Raum steuert nur der Host; Gäste sehen den Zustand, tippen und lösen auf."""
+    return current_room() is None or bool(session.get('room_host'))
+
+def host_only(view):
+    """Für Steuer- und Einstellungsrouten: Gäste eines Raums werden abgewiesen."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not can_control_playback():
+            if wants_json() or request.method == 'POST':
+                return jsonify({'success': False, 'error': 'Nur der Host steuert den Raum.'}), 403
+            return redirect(url_for('home'))
+        return view(*args, **kwargs)
+    return wrapper
+
+def room_join_blocked():
+    """True, wenn diese IP in der letzten Minute zu viele unbekannte Raumcodes probiert hat."""
+    try:
+        failures = get_redis().get(f"music-quiz:room-join-failures:{request.remote_addr}")
+    except redis.RedisError as e:
+        print(f"Redis-Fehler bei der Beitrittsbremse: {e}")
+        return False
+    return failures is not None and int(failures) >= room_join_failures_per_minute
+
+def record_failed_join():
+    key = f"music-quiz:room-join-failures:{request.remote_addr}"
+    try:
+        r = get_redis()
+        # Das Fenster beginnt mit dem ersten Fehlversuch und wird nicht verlängert
+        if r.incr(key) == 1:
+            r.expire(key, 60)
+    except redis.RedisError as e:
+        print(f"Redis-Fehler bei der Beitrittsbremse: {e}")
+
+def room_info():
+    """Raum-Angaben für Template und /api/state."""
+    room = current_room()
+    if room is None:
+        return None
+    return {'code': room['code'], 'version': room['version'], 'is_host': can_control_playback()}
+
+### 🃏 QUIZ-DECKS ###
+
+# Gekürzte Track-Objekte: genug für Deck, Originalversion und Cover
+PLAYLIST_TRACK_FIELDS = ("items(track(id,uri,name,type,is_local,is_playable,duration_ms,external_ids,"
+                         "artists(name),album(id,name,release_date,images))),next")
+
+playlist_cache = SharedCache('playlist-tracks', 16, playlist_cache_ttl_seconds)
+
+def load_playlist_tracks(sp, playlist_id):
+    """Alle abspielbaren Tracks einer Playlist, über den gemeinsamen Cache geteilt."""
+    def fetch():
+        tracks = []
+        # market=from_token: Spotify ersetzt regional gesperrte Tracks, die IDs entsprechen dann dem, was gespielt wird
+        page = sp.playlist_items(playlist_id, fields=PLAYLIST_TRACK_FIELDS, market='from_token', additional_types=('track',))
+        while page:
+            for item in page.get('items') or []:
+                track = item.get('track')
+                if track and track.get('id') and track.get('type') == 'track' and not track.get('is_local') and track.get('is_playable', True):
+                    tracks.append(track)
+            page = sp.next(page) if page.get('next') else None
+        return tracks or None
+    return playlist_cache.get_or_compute(playlist_id, fetch) or []
+
+def build_deck(sp, playlist_id):
+    """Zieht deck_size zufällige Songs aus der Playlist, ohne Wiederholung."""
+    tracks = load_playlist_tracks(sp, playlist_id)
+    if not tracks:
+        raise ValueError("Die Playlist enthält keine abspielbaren Songs.")
+    picked = random.sample(tracks, min(deck_size, len(tracks)))
+    return {'playlist_id': playlist_id, 'track_ids': [track['id'] for track in picked]}
+
+def deck_position(deck, track_id):
+    """Position des Tracks im Deck oder None, wenn er nicht (mehr) aus dem Deck stammt."""
+    if not deck or not track_id or track_id not in deck['track_ids']:
+        return None
+    return deck['track_ids'].index(track_id)
+
+def deck_tracks_from(deck, position):
+    """
+    Track-Objekte ab position für die Vorberechnung, nur aus dem Cache.
+    None, wenn die Playlist dort nicht (mehr) liegt.
+    """
+    hit, tracks = playlist_cache.get(deck['playlist_id'], count=False)
+    if not hit or not tracks:
+        return None
+    by_id = {track['id']: track for track in tracks}
+    ids = deck['track_ids'][position:position + 1 + queue_enrichment_depth]
+    return [by_id[track_id] for track_id in ids if track_id in by_id]
+
+def advance_deck(sp, current_track_id):
+    """
+    Nächster Song aus dem Deck. Läuft gerade ein Song aus dem Deck, genügt ein einziges
+    next, denn der Nachfolger ist bekannt. Sonst (kein Deck, aufgebraucht, anderer Song)
+    wird ein neues Deck gezogen und als Liste gestartet.
+    Gibt (deck, position) des erwarteten Songs zurück.
+    """
+    deck = get_quiz_setting('deck')
+    if deck and deck.get('playlist_id') != random_playlist_id:
+        deck = None
+    position = deck_position(deck, current_track_id)
+    if position is not None and position + 1 < len(deck['track_ids']):
+        sp.next_track()
+        return deck, position + 1
+
+    deck = build_deck(sp, random_playlist_id)
+    # Ohne Shuffle spielt Spotify die Liste in unserer Reihenfolge ab
+    sp.shuffle(False)
+    sp.start_playback(uris=[f"spotify:track:{track_id}" for track_id in deck['track_ids']])
+    set_quiz_setting('deck', deck, notify=False)
+    return deck, 0
+
+def schedule_round_enrichment(sp, track_id):
+    """Vorberechnung nach einem Trackwechsel; aus dem Deck sind die nächsten Songs schon bekannt."""
+    deck = get_quiz_setting('deck')
+    position = deck_position(deck, track_id)
+    upcoming = deck_tracks_from(deck, position) if position is not None else None
+    schedule_queue_enrichment(sp, get_spotify_user_id(sp), track_id, upcoming)
+
+### 🏆 TIPPS UND BESTENLISTE ###
+
+def original_release(track_item, earliest):
+    """(Jahr, Album) der Originalversion: die früheste gefundene, sonst das Album des Tracks."""
+    year = int(track_item["album"]["release_date"].split('-')[0])
+    if earliest and earliest['year'] < year:
+        return earliest['year'], earliest['album_name']
+    return year, track_item["album"]["name"]
+
+def _normalize_name(name):
+    return re.sub(r"[^0-9a-z]+", "", (name or "").lower())
+
+def name_matches(guess, candidates):
+    """Tipp gegen mögliche Antworten, unempfindlich gegen Groß-/Kleinschreibung, Satzzeichen und Tippfehler."""
+    guess = _normalize_name(guess)
+    if not guess:
+        return False
+    return any(
+        difflib.SequenceMatcher(None, guess, _normalize_name(candidate)).ratio() >= guess_name_min_ratio
+        for candidate in candidates
+    )
+
+def score_guess(guess, answer):
+    """Punkte für einen Tipp; answer enthält year, artists (Liste) und titles (Liste)."""
+    points = 0
+    if isinstance(guess.get('year'), int):
+        points += max(0, guess_year_points - guess_year_penalty * abs(guess['year'] - answer['year']))
+    if name_matches(guess.get('artist'), answer['artists']):
+        points += guess_name_points
+    if name_matches(guess.get('title'), answer['titles']):
+        points += guess_name_points
+    return points
+
+class Leaderboard:
+    """
+    Tipps und Punktestände in Redis, getrennt nach Bereich (Raum oder Konto).
+    Die Bestenliste ist ein Sorted Set: Punkte vergeben kostet O(log n) pro Spieler,
+    Lesen ist ein einziger Roundtrip (Top-Liste, Namen, eigener Rang).
+    """
+    def _key(self, scope, *parts):
+        return ":".join(("music-quiz", *parts, scope))
+
+    def available(self):
+        return get_redis() is not None
+
+    def submit(self, scope, round_id, player_id, name, guess):
+        """Speichert den Tipp eines Spielers für die Runde; ein neuer Tipp ersetzt den alten."""
+        guesses_key = self._key(scope, 'guesses', round_id)
+        pipe = get_redis().pipeline()
+        pipe.hset(guesses_key, player_id, json.dumps(guess))
+        pipe.expire(guesses_key, room_ttl_seconds)
+        pipe.hset(self._key(scope, 'players'), player_id, name)
+        pipe.expire(self._key(scope, 'players'), room_ttl_seconds)
+        pipe.execute()
+
+    def is_scored(self, scope, round_id):
+        return bool(get_redis().exists(self._key(scope, 'scored', round_id)))
+
+    def score_round(self, scope, round_id, answer):
+        """
+        Wertet alle Tipps der Runde aus, genau einmal (auch bei parallelem Auflösen).
+        Gibt {player_id: Punkte} zurück, oder None, wenn die Runde schon gewertet war.
+        """
+        r = get_redis()
+        if not r.set(self._key(scope, 'scored', round_id), 1, nx=True, ex=room_ttl_seconds):
+            return None
+        guesses = r.hgetall(self._key(scope, 'guesses', round_id))
+        results = {
+            player_id.decode(): score_guess(json.loads(raw), answer)
+            for player_id, raw in guesses.items()
+        }
+        board_key = self._key(scope, 'leaderboard')
+        pipe = r.pipeline()
+        for player_id, points in results.items():
+            # Auch 0 Punkte eintragen, damit jeder Mitspieler in der Liste steht
+            pipe.zincrby(board_key, points, player_id)
+        pipe.expire(board_key, room_ttl_seconds)
+        pipe.delete(self._key(scope, 'last-round'))
+        if results:
+            pipe.hset(self._key(scope, 'last-round'), mapping=results)
+            pipe.expire(self._key(scope, 'last-round'), room_ttl_seconds)
+        pipe.execute()
+        return results
+
+    def read(self, scope, player_id=None):
+        """Top-Liste mit Namen, Punkten der letzten Runde und dem eigenen Rang."""
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.zrevrange(self._key(scope, 'leaderboard'), 0, leaderboard_size - 1, withscores=True)
+        pipe.hgetall(self._key(scope, 'players'))
+        pipe.hgetall(self._key(scope, 'last-round'))
+        if player_id:
+            pipe.zrevrank(self._key(scope, 'leaderboard'), player_id)
+            pipe.zscore(self._key(scope, 'leaderboard'), player_id)
+        top, names, last_round, *mine = pipe.execute()
+        names = {k.decode(): v.decode() for k, v in names.items()}
+        last_round = {k.decode(): int(v) for k, v in last_round.items()}
+        players = [
+            {'rank': rank, 'name': names.get(member.decode(), 'Unbekannt'), 'score': int(score),
+             'last_round': last_round.get(member.decode()), 'is_me': member.decode() == player_id}
+            for rank, (member, score) in enumerate(top, start=1)
+        ]
+        me = None
+        if player_id and mine[0] is not None:
+            me = {'rank': mine[0] + 1, 'score': int(mine[1]), 'last_round': last_round.get(player_id)}
+        return {'players': players, 'me': me}
+
+leaderboard = Leaderboard()
+
+def score_scope():
+    """Bestenliste des Raums, ohne Raum die des angemeldeten Kontos."""
+    room = current_room()
+    if room is not None:
+        return room_channel(room['code'])
+    sp = get_spotify_client()
+    return f"user:{get_spotify_user_id(sp)}" if sp else None
+
+def player_id():
+    if 'player_id' not in session:
+        session['player_id'] = secrets.token_hex(6)
+    return session['player_id']
+
+def leaderboard_info():
+    """Bestenliste für Template und /api/state, None ohne Redis."""
+    if not leaderboard.available():
+        return None
+    try:
+        board = leaderboard.read(score_scope(), session.get('player_id'))
+    except redis.RedisError as e:
+        print(f"Bestenliste nicht lesbar: {e}")
+        return None
+    return dict(board, player_name=session.get('player_name', ''))
 
+def score_current_round(sp, quiz_state):
+    """
+    Vergibt beim Auflösen die Punkte für alle Tipps der Runde. Gewertet wird nur
+    gegen die gefundene Originalversion: schlägt die Suche fehl, bleibt die Runde
+    ungewertet und das nächste /solve versucht es erneut.
+    """
+    if not leaderboard.available():
+        return
+    scope = score_scope()
+    round_id = quiz_state.get('round_id') or quiz_state['track_id']
+    if leaderboard.is_scored(scope, round_id):
+        return
+    current_track = get_current_playback(sp)
+    if not current_track or not current_track.get('item') or current_track['item']['id'] != quiz_state.get('track_id'):
+        return
+    item = current_track['item']
+    try:
+        cleaned_track_name, earliest = find_earliest_release(sp, item)
+    except SpotifyRateLimited as e:
+        print(f"Runde {round_id} nicht gewertet, Suche gedrosselt: {e}")
+        return
+    answer = {
+        'year': original_release(item, earliest)[0],
+        'artists': [artist['name'] for artist in item['artists']],
+        'titles': [item['name'], cleaned_track_name],
+    }
+    leaderboard.score_round(scope, round_id, answer)
+
+### 🔀 PARALLELE SCHRITTE BEIM SEITENAUFBAU ###
+
+_snapshot_pool = ThreadPoolExecutor(max_workers=snapshot_workers, thread_name_prefix="snapshot")
+
+def _run_step(name, func):
+    with span(f"step {name}"):
+        return func()
+
+def run_parallel_steps(steps):
+    """
+    Führt unabhängige Schritte gleichzeitig im gemeinsamen Pool aus.
+    steps: {name: (func, timeout_seconds, fallback)}. Ein Schritt, der nicht
+    rechtzeitig fertig wird, liefert fallback und läuft im Hintergrund weiter
+    (sein Ergebnis landet trotzdem in den Caches). Fehler der Schritte werden weitergereicht.
+    """
+    start = time.monotonic()
+    futures = {
+        # Kontext kopieren, damit z.B. die Spotify-Priorität auch im Pool-Thread gilt
+        name: _snapshot_pool.submit(contextvars.copy_context().run, _run_step, name, func)
+        for name, (func, _, _) in steps.items()
+    }
+    results = {}
+    for name, (_, timeout, fallback) in steps.items():
+        try:
+            results[name] = futures[name].result(timeout=max(0, start + timeout - time.monotonic()))
+        except FutureTimeoutError:
+            print(f"Schritt '{name}' nach {timeout}s abgebrochen, weiter ohne Ergebnis.")
+            metrics.inc('music_quiz_snapshot_step_timeouts_total', {'step': name})
+            results[name] = fallback
+    return results
 
 ### 🚀 ROUTEN ###
 
@@ -228,9 +2700,17 @@ def login():
 
 @app.route("/logout")
 def logout():
+    leave_room()
+    sid = session.pop(TOKEN_SID_KEY, None)
+    if sid and token_store.available():
+        try:
+            token_store.delete(sid)
+        except redis.RedisError as e:
+            print(f"Token konnte nicht aus dem Store gelöscht werden: {e}")
     session.pop(TOKEN_INFO_KEY, None)
     session.pop('quiz_state', None)
     session.pop('player_mode', None)
+    session.pop('spotify_user_id', None)
     return redirect(url_for('home'))
 
 @app.route("/callback")
@@ -239,464 +2719,272 @@ def callback():
     code = request.args.get('code')
     token_info = sp_oauth.get_access_token(code)
 
-    session[TOKEN_INFO_KEY] = token_info
+    store_token(token_info)
     return redirect(url_for('home'))
 
-@app.route("/")
-def home():
-    sp = get_spotify_client()
-
-    theme_name = session.get('theme', 'default')
+def build_quiz_snapshot(sp, theme_name):
+    """
+    Kompakter Zustand der Quiz-Seite: Track, Lösung (nur wenn aufgelöst), Fortschritt
+    und Palette. Grundlage für das Template und für /api/state.
+    """
     colors = PALETTES.get(theme_name, PALETTES['default']).copy()
+    is_player_mode = get_quiz_setting('player_mode', False)
+    current_track = get_current_playback(sp)
+    if not current_track or not current_track.get('item'):
+        raise ValueError("Kein abspielbarer Song gefunden.")
+
+    album = current_track["item"]["album"]
+    remember_album_images(album)
+    album_image_url = cover_url(album, cover_display_size) or "https://via.placeholder.com/300/1a1a1a?text=Error"
+
+    current_track_id = current_track['item']['id']
+    quiz_state = get_quiz_setting('quiz_state', {})
+
+    if current_track_id != quiz_state.get('track_id'):
+        quiz_state = start_quiz_round(current_track_id)
+        schedule_round_enrichment(sp, current_track_id)
+
+    show_solution = is_player_mode or quiz_state.get('is_solved', False)
+
+    def find_release():
+        try:
+            return find_earliest_release(sp, current_track["item"])
+        except SpotifyRateLimited as e:
+            # Auch mit Status-Priorität kann der Bucket des Kontos erschöpft sein: dann ohne Originalversion antworten
+            print(f"Originalversion übersprungen: {e}")
+            return None
+
+    # Cover-Analyse und Suche nach der Originalversion hängen nur vom aktuellen Track ab
+    steps = {}
+    if theme_name == 'album':
+        steps['palette'] = (lambda: get_album_palette(album.get("id"), album.get("images")),
+                            snapshot_palette_timeout_seconds, PALETTES['default'])
+    if show_solution:
+        steps['release'] = (find_release, snapshot_release_timeout_seconds, None)
+    results = run_parallel_steps(steps)
+    if 'palette' in results:
+        colors.update(results['palette'])
+
+    album_name = current_track["item"]["album"]["name"]
+    initial_release_year = int(current_track["item"]["album"]["release_date"].split('-')[0])
+    track = None
+
+    # Titel, Interpret und Cover erst nach dem Auflösen herausgeben
+    if show_solution:
+        cleaned_track_name, earliest = results.get('release') or (clean_track_name(current_track["item"]["name"]), None)
+        original_release_year, original_album_name = original_release(current_track["item"], earliest)
+
+        track = {
+            'name': current_track["item"]["name"],
+            'artists': ", ".join([artist["name"] for artist in current_track["item"]["artists"]]),
+            'album_name': album_name,
+            'image_url': album_image_url,
+            'image_srcset': cover_image_srcset(album),
+            'release_year': initial_release_year,
+            'original_release_year': original_release_year,
+            'original_album_name': original_album_name,
+            'cleaned_name': cleaned_track_name,
+            'original_strategy': earliest['strategy'] if earliest else None,
+        }
 
-    if not sp:
-        login_html = f"""
-        <!DOCTYPE html>
-        <html lang="de">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <link rel="preconnect" href="https://fonts.googleapis.com">
-            <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-            <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap" rel="stylesheet">
-            <title>Login - Song Quiz</title>
-            <style>
-                * {{ box-sizing: border-box; }}
-                body {{ 
-                    font-family: 'Inter', -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; 
-                    background-color: #121212; 
-                    color: #B3B3B3; 
-                    display: flex; 
-                    flex-direction: column; 
-                    align-items: center; 
-                    justify-content: flex-start; 
-                    min-height: 100vh; 
-                    margin: 0; 
-                    padding-top: 5vh; 
-                    padding-bottom: 5vh;
-                }}
-                .container {{ 
-                    width: calc(100% - 2rem); 
-                    max-width: 600px; 
-                    padding: 2rem; 
-                    border-radius: 12px; 
-                    background-color: #1a1a1a; 
-                    box-shadow: 0 4px 15px rgba(0, 0, 0, 0.5);
-                    /* --- NEU: Container ist linksbündig --- */
-                    text-align: left;
-                }}
-                .login-icon {{
-                    /* Das SVG wird so hoch wie von dir vorgegeben */
-                    width: 100%;
-                    height: auto;
-                    max-height: 150px; /* Begrenzt die Höhe auf großen Bildschirmen */
-                    /* Negativer unterer Rand, um den Text näher heranzuholen */
-                    margin-bottom: -1rem;
-                    margin-top: -1rem;
-                    /* Korrigiert die Positionierung für die linksbündige Ausrichtung */
-                    margin-left: -2rem; /* Zieht das SVG an den Rand des Containers */
-                }}
-                h1 {{ 
-                    color: #FFFFFF; 
-                    font-size: clamp(2rem, 6vw, 2.8rem); /* Etwas grösser für mehr Wirkung */
-                    margin-bottom: 1rem; 
-                }}
-                h2 {{ 
-                    color: #B3B3B3; 
-                    font-size: clamp(1rem, 3vw, 1.2rem); 
-                    margin: 0.5rem 0 2.5rem;
-                    font-weight: 400;
-                }}
-                .center-wrapper {{
-                    text-align: center;
-                }}
-                .button {{ 
-                    padding: 12px 24px; 
-                    background-color: {colors['highlight_color']}; 
-                    color: {colors['button_text_color']}; 
-                    text-decoration: none; 
-                    border-radius: 50px; 
-                    font-weight: bold; 
-                    transition: background-color 0.3s, transform 0.3s; 
-                    display: inline-block; 
-                }}
-                .button:hover {{ 
-                    background-color: {colors['button_hover_color']}; 
-                    transform: scale({button_hover_scale}); 
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <img class="login-icon" src="{{{{ url_for('static', filename='icon2-sq-extended-cut.svg') }}}}" alt="Song Quiz Logo">
-                <div class="center-wrapper">
-                    <h1>Willkommen beim<br>Song Quiz</h1>
-                    <h2>Bitte melde dich mit deinem Spotify Konto an,<br>um fortzufahren.</h2>
-                    <a href="/login" class="button">Anmelden</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return render_template_string(login_html)
+    return {
+        'track_id': current_track_id,
+        'album_id': album.get('id'),
+        'progress_ms': current_track.get('progress_ms', 0),
+        'duration_ms': current_track['item'].get('duration_ms', 0),
+        'is_playing': current_track.get('is_playing', False),
+        'solved': show_solution,
+        'player_mode': is_player_mode,
+        'theme': theme_name,
+        'palette': colors,
+        'track': track,
+        'room': room_info(),
+        'leaderboard': leaderboard_info(),
+    }
 
-    try:
-        is_player_mode = session.get('player_mode', False)
-        current_track = sp.currently_playing()
-        if not current_track or not current_track.get('item'):
-            raise ValueError("Kein abspielbarer Song gefunden.")
+def wants_json():
+    """True für fetch()-Aufrufe der Quiz-Seite, die JSON statt eines Redirects erwarten."""
+    return request.accept_mimetypes.best == 'application/json'
 
-        album_image_url = "https://via.placeholder.com/300/1a1a1a?text=Error"
-        if current_track["item"]["album"]["images"]:
-            album_image_url = current_track["item"]["album"]["images"][0]["url"]
+def live_updates():
+    """
+    /events nur, wenn eingeschaltet und der Server Anfragen nebenläufig bedient: Ein
+    Sync-Worker wäre sonst pro Tab bis zu sse_stream_seconds blockiert. Gunicorn setzt
+    wsgi.multithread bei gthread- und gevent-Workern, sonst pollen die Tabs wie bisher.
+    """
+    return server_sent_events and bool(request.environ.get('wsgi.multithread'))
 
-        if theme_name == 'album':
-            dynamic_palette = analyze_album_art(album_image_url)
-            colors.update(dynamic_palette)
-
-        current_track_id = current_track['item']['id']
-        quiz_state = session.get('quiz_state', {})
-
-        if current_track_id != quiz_state.get('track_id'):
-            quiz_state = {'track_id': current_track_id, 'is_solved': False}
-            session['quiz_state'] = quiz_state
-
-        show_solution = is_player_mode or quiz_state.get('is_solved', False)
-        progress_ms = current_track.get('progress_ms', 0)
-        duration_ms = current_track['item'].get('duration_ms', 0)
-        is_playing = current_track.get('is_playing', False)
-
-        display_title = "Welcher Song ist das?"
-        display_artist = "Wer ist der Interpret?"
-        year_question_html = f'<h3 class="year-question">Aus welchem Jahr?</h3>'
-        info_section_html = ""
-        button_text = "Auflösen"
-        button_link = "/solve"
-        player_mode_checked = 'checked' if is_player_mode else ''
-
-        image_html = f"""
-        <div class="placeholder-quiz">
-            <svg class="quiz-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
-                <circle cx="12" cy="12" r="10"></circle>
-                <path d="M9.09 9a3 3 0 0 1 5.83 1c0 2-3 3-3 3"></path>
-                <line x1="12" y1="17" x2="12.01" y2="17"></line>
-            </svg>
-        </div>
-        """
+def respond_with_state():
+    """Links führen wie bisher zur Startseite, fetch()-Aufrufe erhalten den neuen Zustand als JSON."""
+    if wants_json():
+        return api_state()
+    return redirect(url_for('home'))
 
-        track_name_raw = current_track["item"]["name"]
-        artists_string = ", ".join([artist["name"] for artist in current_track["item"]["artists"]])
-        album_name = current_track["item"]["album"]["name"]
-        initial_release_year = int(current_track["item"]["album"]["release_date"].split('-')[0])
-
-        if show_solution:
-            display_title = track_name_raw
-            display_artist = artists_string
-            year_question_html = ""
-            button_text = "Nächstes Lied"
-            button_link = "/next"
-            image_html = f'<img class="album-art" src="{album_image_url}" alt="Album Cover">'
-
-            original_release_year = initial_release_year
-            original_album_name = album_name
-
-            terms_to_remove = [
-                r"\s*-\s*\d{4}\s*Remastered.*", r"\s*-\s*Remastered.*",
-                r"\s*-\s*\d{4}\s*Remaster.*", r"\s*-\s*Remaster.*",
-                r"\(Remastered\)", r"\[Remastered\]",
-                r"\(Remaster\)", r"\[Remaster\]",
-                r"\s+-\s*Live.*", r"\(Live\)", r"\[Live\]",
-                r"\s*-\s*Edit.*", r"\(Edit\)",
-                r"\s*-\s*Single.*",  r"\(Single Version\)",
-                r"\s*-\s*Mono.*", r"\(Mono Version\)",
-                r"\s*-\s*Stereo.*", r"\(Stereo Version\)",
-                r"\s*-\s*Original.*", r"\(Original Version\)", r"\(Original\)",
-                r"\s*-\s*Radio.*", r"\(Radio Version\)", r"\(Radio\)"
-            ]
+def respond_after_command():
+    """Wie respond_with_state(); mit Live-Updates kommt der Zustand nach Steuerbefehlen per /events."""
+    if confirms_in_background():
+        return jsonify({'pending': True})
+    return respond_with_state()
 
-            cleaned_track_name = track_name_raw
-            for pattern in terms_to_remove:
-                cleaned_track_name = re.sub(pattern, "", cleaned_track_name, flags=re.IGNORECASE).strip()
+@app.route("/")
+def home():
+    sp = get_spotify_client()
 
-            original_artist_names = [artist["name"].lower() for artist in current_track["item"]["artists"]]
+    theme_name = get_quiz_setting('theme', 'default')
+    colors = PALETTES.get(theme_name, PALETTES['default']).copy()
 
-            results = sp.search(q=f"track:{cleaned_track_name} artist:{artists_string}", type="track", limit=50)
-            for result in results['tracks']['items']:
-                try:
-                    result_track_name_raw = result['name']
-                    cleaned_result_track_name = result_track_name_raw
-                    for pattern in terms_to_remove:
-                        cleaned_result_track_name = re.sub(pattern, "", cleaned_result_track_name, flags=re.IGNORECASE).strip()
-
-                    if cleaned_track_name.lower() == cleaned_result_track_name.lower():
-                        result_artist_names = [artist["name"].lower() for artist in result["artists"]]
-                        if any(artist_name in result_artist_names for artist_name in original_artist_names):
-                            result_year = int(result['album']['release_date'].split('-')[0])
-                            if result_year < original_release_year:
-                                original_release_year = result_year
-                                original_album_name = result['album']['name']
-                except (KeyError, ValueError):
-                    continue
+    if not sp:
+        return render_template('login.html', css_variables=css_variables(colors),
+                               rooms_available=room_store.available(), join_error=session.pop('join_error', None))
 
-            initial_year_html = ""
-            original_info_html = ""
-            prominent_year_html = f'<p class="prominent-year">{initial_release_year}</p>'
-            if original_release_year < initial_release_year:
-                prominent_year_html = f'<p class="prominent-year">{original_release_year}</p>'
-                initial_year_html = f'<p><strong>Veröffentlichungsjahr:</strong> {initial_release_year}</p>'
-                original_info_html = f"""<div class="info-box"><h3>Originalversion</h3><p><strong>Original-Titel für Suche:</strong> {cleaned_track_name}</p><p><strong>Original-Album:</strong> {original_album_name}</p></div>"""
-
-            info_section_html = f"""
-            <div class="info-section">
-                <hr class="info-divider">
-                <div class="info-box">
-                    <p><strong>Album:</strong> {album_name}</p>
-                    {initial_year_html}
-                </div>
-                {original_info_html}
-                {prominent_year_html}
-            </div>
-            """
-
-        temp_palettes = PALETTES.copy()
-        if theme_name == 'album':
-            temp_palettes['album'] = colors
-
-        options_html = ""
-        album_theme_active_class = "album-theme-active" if theme_name == 'album' else ""
-        main_dot_style = f"background-color: {colors['highlight_color']};" if theme_name != 'album' else ""
-
-        for key, palette in temp_palettes.items():
-            album_dot_class = "album-theme-active" if key == 'album' else ""
-            dot_style = f'background-color: {palette["highlight_color"]};' if key != 'album' else ''
-            options_html += f'<a href="/set-theme/{key}" class="theme-dot {album_dot_class}" style="{dot_style}" title="{palette["name"]}"></a>'
-
-        theme_selector_html = f"""
-        <div class="theme-picker">
-            <div id="theme-picker-toggle" class="theme-dot main-dot {album_theme_active_class}" style="{main_dot_style}" title="Farbe ändern"></div>
-            <div id="theme-options" class="theme-options-container">
-                {options_html}
-            </div>
-        </div>
-        """
+    try:
+        with span('build snapshot'):
+            snapshot = build_quiz_snapshot(sp, theme_name)
 
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="de">
-        <head>
-        <meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <link rel="preconnect" href="https://fonts.googleapis.com">
-        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap" rel="stylesheet">
-
-        <link rel="icon" href="{{{{ url_for('static', filename='{icon_svg}') }}}}" type="image/svg+xml">
-        <link rel="apple-touch-icon" href="{{{{ url_for('static', filename='{icon_png}') }}}}">
-
-        <title>Song Quiz</title>
-        <style>
-            * {{ box-sizing: border-box; }}
-            body {{ font-family: 'Inter', -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background-color: #121212; color: #B3B3B3; display: flex; flex-direction: column; align-items: center;justify-content: flex-start;min-height: 100vh; margin: 0; text-align: center;padding-top: 5vh;padding-bottom: 5vh;}}
-            .container {{ width: calc(100% - 2rem); max-width: 600px; padding: 2rem; border-radius: 12px; background-color: #1a1a1a; box-shadow: 0 4px 15px rgba(0, 0, 0, 0.5); }}
-            .album-art-container {{ display: flex; align-items: center; justify-content: center; gap: 20px; width: 100%; max-width: 450px; margin: 0 auto 1.5rem; }}
-            .album-art-link {{ flex: 1 1 0; min-width: 0; display: flex; justify-content: center; transition: transform 0.3s ease; }}
-            .album-art-link:hover {{ transform: scale({album_art_hover_scale}); }}
-            .album-art, .placeholder-quiz {{ width: 100%; max-width: 300px; height: auto; aspect-ratio: 1 / 1; border-radius: 8px; box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3); }}
-            .placeholder-quiz {{ display: flex; align-items: center; justify-content: center; background-color: #282828; }}
-            .quiz-icon {{ width: 60%; height: auto; stroke: {colors['highlight_color']}; transition: stroke 0.2s ease-in-out; }}
-            .album-art-link:hover .quiz-icon {{ stroke: {colors['button_hover_color']}; }}
-            .control-arrow svg {{ width: {arrow_size}; height: {arrow_size}; stroke: {colors['highlight_color']}; stroke-width: {arrow_thickness}; transition: transform 0.3s ease, stroke 0.3s ease; }}
-            .control-arrow:hover svg {{ stroke: {colors['button_hover_color']}; transform: scale({arrow_hover_scale}); }}
-            h1 {{ color: #FFFFFF; font-size: clamp(1.5rem, 6vw, 2.5rem); margin-bottom: 0.5rem; min-height: 1.2em; }}
-            h2 {{ color: #B3B3B3; font-size: clamp(1rem, 3vw, 1.2rem); margin: 0.5rem 0 1.5rem; min-height: 1.2em; }}
-            .year-question {{ color: {colors['highlight_color']}; font-size: clamp(1.1rem, 4vw, 1.4rem); font-weight: bold; margin-top: 2rem; margin-bottom: 1.5rem;}}
-            .info-section {{ width: 100%; text-align: center; }}
-            .info-box strong {{ color: #FFFFFF; }}
-            .info-box h3 {{ color: #FFFFFF; margin-top: 1.5rem; margin-bottom: 0.5rem;}}
-            .info-divider {{ margin: 2rem 0; border: 0; border-top: 1px solid #333; }}
-            .button-container {{ display: flex; justify-content: center; align-items: center; gap: 15px; flex-wrap: wrap; }}
-            .button {{ padding: 12px 24px; background-color: {colors['highlight_color']}; color: {colors['button_text_color']}; text-decoration: none; border-radius: 50px; font-weight: bold; margin-top: 20px; display: inline-block; transition: background-color 0.3s, transform 0.3s ease; }}
-            .button:hover {{ background-color: {colors['button_hover_color']}; transform: scale({button_hover_scale}); }}
-            .prominent-year {{ font-size: clamp(3rem, 12vw, 4rem); font-weight: bold; color: {colors['highlight_color']}; margin: 1rem 0; }}
-            .progress-svg-container {{ width: 80%; max-width: 350px; margin: 20px auto 0; }}
-            .progress-interactive-area {{ width: 80%; margin: 0 auto; height: 14px; cursor: pointer; }}
-            .progress-interactive-area svg {{ width: 100%; height: 100%; overflow: visible; }}
-            #progressTrack, #progressFill {{ fill: none; stroke-width: {progress_bar_thickness}; stroke-linecap: round; stroke-linejoin: round; transition: stroke-width 0.2s ease, stroke 0.2s ease; }}
-            #progressTrack {{ stroke: #444; }}
-            #progressFill {{ stroke: {colors['highlight_color']}; }}
-            .progress-interactive-area:hover #progressFill, .progress-interactive-area:hover #progressTrack {{ stroke-width: {progress_bar_thickness + progress_bar_hover_increase_px}; }}
-            .progress-interactive-area:hover #progressFill {{ stroke: {colors['button_hover_color']}; }}
-            .player-mode-toggle {{ margin-top: 30px; margin-bottom: 15px; display: flex; flex-direction: column; align-items: center; gap: 10px; }}
-            .toggle-label {{ font-size: 0.9rem; color: #B3B3B3; }}
-            .controls-cluster {{ display: flex; align-items: center; justify-content: center; gap: 18px; }}
-            .switch {{ position: relative; display: inline-block; width: 50px; height: 28px; }}
-            .switch input {{ opacity: 0; width: 0; height: 0; }}
-            .slider {{ position: absolute; cursor: pointer; top: 0; left: 0; right: 0; bottom: 0; background-color: #444; transition: .4s; border-radius: 28px; }}
-            .slider:before {{ position: absolute; content: ""; height: 22px; width: 22px; left: 3px; bottom: 3px; background-color: #1a1a1a; transition: .4s; border-radius: 50%; }}
-            input:checked + .slider {{ background-color: {colors['highlight_color']}; }}
-            input:checked + .slider:before {{ transform: translateX(22px); }}
-            .random-song-button {{ display: flex; align-items: center; justify-content: center; width: 34px; height: 34px; background-color: #333; border-radius: 50%; transition: background-color 0.3s ease; }}
-            .random-song-button svg {{ width: 18px; height: 18px; stroke: #B3B3B3; transition: stroke 0.3s ease; }}
-            .random-song-button:hover {{ background-color: {colors['highlight_color']}; }}
-            .random-song-button:hover svg {{ stroke: {colors['button_text_color']}; }}
-            .theme-picker {{ position: relative; display: flex; }}
-            .theme-options-container {{ position: absolute; bottom: 130%; left: 50%; transform: translateX(-50%); display: flex; gap: 12px; padding: 10px; background-color: #282828; border-radius: 50px; box-shadow: 0 4px 10px rgba(0,0,0,0.4); opacity: 0; visibility: hidden; transform: translate(-50%, 10px); transition: opacity 0.3s ease, transform 0.3s ease, visibility 0.3s; }}
-            .theme-options-container.active {{ opacity: 1; visibility: visible; transform: translate(-50%, 0); }}
-            .theme-dot {{ width: 24px; height: 24px; border-radius: 50%; border: 2px solid #555; transition: transform 0.2s, background 0.3s; display: block; cursor: pointer; }}
-            .theme-dot:hover {{ transform: scale(1.2); }}
-            .main-dot {{ width: 30px; height: 30px; border-color: #888; }}
-
-            .album-theme-active {{
-                background: linear-gradient(135deg,rgba(246, 255, 0, 1) 10%, rgba(255, 199, 0, 1) 18%, rgba(255, 117, 0, 1) 24%, rgba(255, 0, 0, 1) 35%, rgba(218, 0, 255, 1) 47%, rgba(117, 82, 255, 1) 60%, rgba(0, 178, 255, 1) 71%, rgba(0, 255, 133, 1) 83%, rgba(246, 255, 0, 1) 100%);
-            }}
-
-        </style>
-        </head>
-        <body>
-        <div class="container">
-            <div class="album-art-container">
-                <a href="/previous" class="control-arrow"><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-linecap="round" stroke-linejoin="round"><polyline points="15 18 9 12 15 6"></polyline></svg></a>
-                <a href="/play_pause" class="album-art-link">{image_html}</a>
-                <a href="/next" class="control-arrow"><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-linecap="round" stroke-linejoin="round"><polyline points="9 18 15 12 9 6"></polyline></svg></a>
-            </div>
-            <div class="progress-svg-container"><div class="progress-interactive-area"><svg viewBox="0 0 300 14"><path id="progressTrack" d=""></path><path id="progressFill" d=""></path></svg></div></div>
-            <h1>{display_title}</h1><h2>{display_artist}</h2>{year_question_html}{info_section_html}
-            <div class="button-container">
-                <a href="{button_link}" class="button">{button_text}</a>
-            </div>
-            <div class="player-mode-toggle">
-                <label for="playerMode" class="toggle-label">Player-Modus</label>
-                <div class="controls-cluster">
-                    {theme_selector_html}
-                    <label class="switch">
-                        <input type="checkbox" id="playerMode" name="playerMode" {player_mode_checked}>
-                        <span class="slider"></span>
-                    </label>
-                    <a href="/play_random" class="random-song-button" title="Zufälliger Song aus Playlist">
-                        <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
-                            <rect x="3" y="3" width="18" height="18" rx="2" ry="2"></rect>
-                            <circle cx="8.5" cy="8.5" r="0.5" fill="currentColor"></circle>
-                            <circle cx="15.5" cy="15.5" r="0.5" fill="currentColor"></circle>
-                            <circle cx="15.5" cy="8.5" r="0.5" fill="currentColor"></circle>
-                            <circle cx="8.5" cy="15.5" r="0.5" fill="currentColor"></circle>
-                            <circle cx="12" cy="12" r="0.5" fill="currentColor"></circle>
-                        </svg>
-                    </a>
-                </div>
-            </div>
-            <a href="/logout" style="font-size: 0.8rem; color: #888; margin-top: 10px; display:inline-block;">Logout</a>
-        </div>
-
-        <script>
-            document.addEventListener('DOMContentLoaded', function() {{
-                const progressTrack = document.getElementById('progressTrack'); const progressFill = document.getElementById('progressFill'); const interactiveArea = document.querySelector('.progress-interactive-area'); const svgWidth = 300; const svgHeight = 14; const midHeight = svgHeight / 2; const amplitude = 6; const frequency = 0.05; const segments = 150; const waveSpeed = {wave_animation_speed};
-                let initialTrackId = '{current_track_id}'; const pollingInterval = {polling_interval_seconds} * 1000;
-                if (initialTrackId === 'None') {{ initialTrackId = null; }}
-                let currentProgress = {progress_ms}; const totalDuration = {duration_ms}; const isPlaying = {str(is_playing).lower()};
-                let animationFrameId = null; let animationStartTime = performance.now();
-                function generateWavePath(phase) {{ let path = `M 0 ${{midHeight}}`; for (let i = 0; i <= segments; i++) {{ const x = (i / segments) * svgWidth; const fadeWidth = svgWidth * 0.1; let currentAmplitude = amplitude; if (x < fadeWidth) {{ currentAmplitude = amplitude * Math.sin((x / fadeWidth) * (Math.PI / 2)); }} else if (x > svgWidth - fadeWidth) {{ currentAmplitude = amplitude * Math.sin(((svgWidth - x) / fadeWidth) * (Math.PI / 2)); }} const y = midHeight + Math.sin(x * frequency + phase) * currentAmplitude; path += ` L ${{x.toFixed(3)}} ${{y.toFixed(3)}}`; }} return path; }}
-                function updateProgressBar(progress) {{ if (totalDuration > 0) {{ const progressRatio = Math.min(progress / totalDuration, 1); const dynamicPhase = progressRatio * Math.PI * waveSpeed; const wavePath = generateWavePath(dynamicPhase); progressTrack.setAttribute('d', wavePath); progressFill.setAttribute('d', wavePath); const totalLength = progressFill.getTotalLength(); if (totalLength > 0) {{ progressFill.style.strokeDasharray = totalLength; progressFill.style.strokeDashoffset = totalLength * (1 - progressRatio); }} }} }}
-                function animate(currentTime) {{ const elapsedTime = currentTime - animationStartTime; const newProgress = currentProgress + elapsedTime; updateProgressBar(newProgress); if (newProgress < totalDuration) {{ animationFrameId = requestAnimationFrame(animate); }} }}
-                function startAnimation() {{ if (isPlaying) {{ animationStartTime = performance.now(); animationFrameId = requestAnimationFrame(animate); }} }}
-                function stopAnimation() {{ if (animationFrameId) {{ cancelAnimationFrame(animationFrameId); animationFrameId = null; }} }}
-                updateProgressBar(currentProgress); startAnimation();
-                interactiveArea.addEventListener('click', function(event) {{ if (totalDuration > 0) {{ stopAnimation(); const rect = interactiveArea.getBoundingClientRect(); const clickX = event.clientX - rect.left; const clickPercentage = Math.max(0, Math.min(1, clickX / rect.width)); const seekPositionMs = Math.round(clickPercentage * totalDuration); currentProgress = seekPositionMs; updateProgressBar(currentProgress); startAnimation(); fetch('/seek', {{ method: 'POST', headers: {{ 'Content-Type': 'application/json' }}, body: JSON.stringify({{ position_ms: seekPositionMs }}) }}).catch(error => console.error('Error seeking track:', error)); }} }});
-                setInterval(function() {{ fetch('/check-song').then(response => response.ok ? response.json() : Promise.reject('Network response was not ok')).then(data => {{ if (data && data.track_id !== initialTrackId) {{ window.location.reload(); }} }}).catch(error => console.error('Error during polling:', error)); }}, pollingInterval);
-                const playerModeToggle = document.getElementById('playerMode');
-                if (playerModeToggle) {{ playerModeToggle.addEventListener('change', function() {{ const isEnabled = this.checked; fetch('/toggle-player-mode', {{ method: 'POST', headers: {{ 'Content-Type': 'application/json' }}, body: JSON.stringify({{ playerMode: isEnabled }}) }}).then(response => response.ok ? response.json() : Promise.reject('Failed to toggle mode')).then(data => {{ if (data.success) {{ window.location.reload(); }} }}).catch(error => console.error('Error:', error)); }}); }}
-                const themePickerToggle = document.getElementById('theme-picker-toggle');
-                const themeOptions = document.getElementById('theme-options');
-                if (themePickerToggle && themeOptions) {{
-                    themePickerToggle.addEventListener('click', function(event) {{
-                        event.stopPropagation();
-                        themeOptions.classList.toggle('active');
-                    }});
-                    document.addEventListener('click', function() {{
-                        if (themeOptions.classList.contains('active')) {{
-                            themeOptions.classList.remove('active');
-                        }}
-                    }});
-                }}
-            }});
-        </script>
-        </body>
-        </html>
-        """
+        palettes = PALETTES.copy()
+        if theme_name == 'album':
+            palettes['album'] = snapshot['palette']
+
+        quiz_config = {
+            'state': snapshot,
+            'pollingIntervalSeconds': polling_interval_seconds,
+            'waveAnimationSpeed': wave_animation_speed,
+            'serverSentEvents': live_updates(),
+            'canControl': can_control_playback(),
+            'palettes': PALETTES,
+        }
 
-        return render_template_string(html_content)
+        with span('render template'):
+            return render_template(
+                'quiz.html',
+                css_variables=css_variables(snapshot['palette']),
+                snapshot=snapshot,
+                palettes=palettes,
+                icon_svg=icon_svg,
+                icon_png=icon_png,
+                cover_display_size=cover_display_size,
+                quiz_config=quiz_config,
+                logged_in=bool(session.get(TOKEN_SID_KEY) or session.get(TOKEN_INFO_KEY)),
+                rooms_available=room_store.available(),
+            )
 
     except Exception as e:
-        theme_name = session.get('theme', 'default')
         colors = PALETTES.get(theme_name, PALETTES['default'])
-        
-        # NEUE, VERBESSERTE FEHLERSEITE
-        image_html_error = f"""
-        <div class="placeholder-quiz">
-            <svg class="quiz-icon" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
-                <circle cx="12" cy="12" r="10"></circle>
-                <polygon points="10 8 16 12 10 16 10 8"></polygon>
-            </svg>
-        </div>
-        """
-        
-        error_html = f"""
-        <!DOCTYPE html>
-        <html lang="de">
-        <head>
-            <meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <link rel="preconnect" href="https://fonts.googleapis.com">
-            <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-            <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap" rel="stylesheet">
-            <title>Fehler - Song Quiz</title>
-            <style>
-                * {{ box-sizing: border-box; }}
-                body {{ font-family: 'Inter', -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background-color: #121212; color: #B3B3B3; display: flex; flex-direction: column; align-items: center; justify-content: flex-start; min-height: 100vh; margin: 0; text-align: center; padding-top: 5vh; padding-bottom: 5vh; }}
-                .container {{ width: calc(100% - 2rem); max-width: 600px; padding: 2rem; border-radius: 12px; background-color: #1a1a1a; box-shadow: 0 4px 15px rgba(0, 0, 0, 0.5); }}
-                .album-art-container {{ display: flex; align-items: center; justify-content: center; gap: 20px; width: 100%; max-width: 450px; margin: 0 auto 1.5rem; }}
-                .album-art-link {{ flex: 1 1 0; min-width: 0; display: flex; justify-content: center; transition: transform 0.3s ease; }}
-                .album-art-link:hover {{ transform: scale({album_art_hover_scale}); }}
-                .placeholder-quiz {{ width: 100%; max-width: 300px; height: auto; aspect-ratio: 1 / 1; border-radius: 8px; box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3); display: flex; align-items: center; justify-content: center; background-color: #282828; }}
-                .quiz-icon {{ width: 50%; height: auto; stroke: {colors['highlight_color']}; transition: stroke 0.2s ease-in-out; }}
-                 .album-art-link:hover .quiz-icon {{ stroke: {colors['button_hover_color']}; }}
-                .control-arrow svg {{ width: {arrow_size}; height: {arrow_size}; stroke: {colors['highlight_color']}; stroke-width: {arrow_thickness}; transition: transform 0.3s ease, stroke 0.3s ease; }}
-                .control-arrow:hover svg {{ stroke: {colors['button_hover_color']}; transform: scale({arrow_hover_scale}); }}
-                h1 {{ color: #FFFFFF; font-size: clamp(1.5rem, 6vw, 2.5rem); margin-bottom: 0.5rem; }}
-                h2 {{ color: #B3B3B3; font-size: clamp(1rem, 3vw, 1.2rem); margin: 0.5rem 0 1.5rem; font-weight: 400; line-height: 1.6; }}
-                .button {{ padding: 12px 24px; background-color: {colors['highlight_color']}; color: {colors['button_text_color']}; text-decoration: none; border-radius: 50px; font-weight: bold; margin-top: 20px; display: inline-block; transition: background-color 0.3s, transform 0.3s ease; }}
-                .button:hover {{ background-color: {colors['button_hover_color']}; transform: scale({button_hover_scale}); }}
-                .error-details {{ margin-top: 2rem; font-size: 0.8rem; color: #666; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="album-art-container">
-                    <a href="/previous" class="control-arrow"><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-linecap="round" stroke-linejoin="round"><polyline points="15 18 9 12 15 6"></polyline></svg></a>
-                    <a href="/play_pause" class="album-art-link">{image_html_error}</a>
-                    <a href="/next" class="control-arrow"><svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-linecap="round" stroke-linejoin="round"><polyline points="9 18 15 12 9 6"></polyline></svg></a>
-                </div>
-                <h1>Fehler oder kein Song aktiv</h1>
-                <h2>Bitte starte die Wiedergabe auf einem deiner Geräte. Du kannst dafür auch auf den Play-Button oben klicken.</h2>
-                <a href="/" class="button">Aktualisieren</a>
-                <p class="error-details"><small>Details: {e}</small></p>
-                <a href="/logout" style="font-size: 0.8rem; color: #888; margin-top: 20px; display:inline-block;">Logout</a>
-            </div>
-        </body>
-        </html>
-        """
-        return render_template_string(error_html)
+        return render_template('error.html', css_variables=css_variables(colors), error=e)
 
+@app.route("/api/state")
+def api_state():
+    """Zustand der Quiz-Seite als JSON, damit sie sich ohne Neuladen aktualisieren kann."""
+    sp = get_spotify_client()
+    if not sp:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        response = jsonify(build_quiz_snapshot(sp, get_quiz_setting('theme', 'default')))
+    except Exception as e:
+        response = jsonify({'track_id': None, 'error': str(e)})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route("/events")
+def events():
+    """
+    Server-Sent Events: ein Stream pro Tab, gespeist vom gemeinsamen Watcher des
+    Kontos. Braucht Gunicorn mit Threads oder gevent (z.B. --worker-class gthread).
+    """
+    sp = get_spotify_client()
+    if not sp or not live_updates():
+        return Response(status=204)  # Browser schließt den EventSource und pollt stattdessen
+    try:
+        user_id = get_spotify_user_id(sp)
+    except Exception as e:
+        print(f"Spotify-Konto für /events nicht ermittelbar: {e}")
+        return Response(status=204)
+    room = current_room()
+    token_sid = room['token_sid'] if room else session.get(TOKEN_SID_KEY)
+    ensure_track_watcher(user_id, get_active_token(), token_sid)
+    subscription = track_events.subscribe(user_id)
+    # Bildschirme eines Raums erhalten auf demselben Stream auch dessen Zustandsänderungen
+    channels = [user_id] + ([room_channel(room['code'])] if room else [])
+    for channel in channels[1:]:
+        track_events.subscribe(channel, subscription)
+
+    def stream():
+        try:
+            yield f"retry: {int(polling_interval_seconds * 1000)}\n\n"
+            last_state = track_events.last_state(user_id)
+            if last_state:
+                yield f"event: track\ndata: {json.dumps(last_state)}\n\n"
+            deadline = time.time() + sse_stream_seconds
+            while time.time() < deadline:
+                try:
+                    event = subscription.get(timeout=sse_heartbeat_seconds)
+                    event_name = 'room' if 'room' in event else 'track'
+                    yield f"event: {event_name}\ndata: {json.dumps(event)}\n\n"
+                except queue.Empty:
+                    ensure_track_watcher(user_id, _account_tokens.get(user_id), token_sid)
+                    yield ": keep-alive\n\n"
+        finally:
+            for channel in channels:
+                track_events.unsubscribe(channel, subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def next_poll_ms(event, in_room=False):
+    """
+    Empfohlener Abstand bis zum nächsten /check-song: mitten im Song selten, kurz nach
+    dem erwarteten Songende wieder. Pausiert oder im Raum gilt das normale Intervall.
+    event ist der kompakte Zustand aus track_event().
+    """
+    default_ms = int(polling_interval_seconds * 1000)
+    if not event['track_id'] or not event['is_playing']:
+        return default_ms
+    remaining_ms = event['duration_ms'] - event['progress_ms']
+    max_ms = default_ms if in_room else int(check_song_max_interval_seconds * 1000)
+    # Kurz nach dem Wechsel fragen, damit der neue Song schon gemeldet wird
+    return max(int(check_song_min_interval_seconds * 1000), min(max_ms, remaining_ms + 300))
+
+def polled_track_state(sp):
+    """
+    Zustand für pollende Tabs über den Track-Watcher des Kontos (im Raum: des Hosts). Über
+    die Redis-Lease fragt nur ein Worker pro Intervall Spotify ab, alle anderen Tabs lesen
+    dessen letzten Zustand. Nur solange noch keiner vorliegt, wird selbst gefragt.
+    """
+    user_id = get_spotify_user_id(sp)
+    room = current_room()
+    token_sid = room['token_sid'] if room else session.get(TOKEN_SID_KEY)
+    ensure_track_watcher(user_id, get_active_token(), token_sid)
+    event = track_events.last_state(user_id)
+    if event is None:
+        event = track_event(get_current_playback(sp))
+    return event
 
 @app.route("/check-song")
 def check_song():
+    """
+    Aktueller Track für pollende Tabs. Das (schwache) ETag hängt nur an Track und Raum-Version,
+    bei If-None-Match antwortet die Route daher meist mit 304. X-Next-Poll-Ms schlägt den
+    Abstand bis zur nächsten Abfrage vor.
+    """
     sp = get_spotify_client()
     if not sp: return jsonify({'track_id': None})
     try:
-        current_track = sp.currently_playing()
-        track_id = current_track['item']['id'] if current_track and current_track.get('item') else None
-        return jsonify({'track_id': track_id})
+        event = polled_track_state(sp)
+        track_id = event['track_id']
+        room = current_room()
+        room_version = room['version'] if room else None
+        hint_ms = next_poll_ms(event, in_room=room is not None)
     except Exception:
         return jsonify({'track_id': None})
 
+    response = jsonify({'track_id': track_id, 'room_version': room_version, 'next_poll_ms': hint_ms})
+    response.set_etag(hashlib.md5(f"{track_id}|{room_version}".encode()).hexdigest()[:16], weak=True)
+    response.headers['X-Next-Poll-Ms'] = str(hint_ms)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/seek', methods=['POST'])
+@host_only
 def seek():
     sp = get_spotify_client()
     if not sp: return jsonify({'success': False, 'error': 'Not logged in'})
@@ -705,135 +2993,317 @@ def seek():
         position_ms = data.get('position_ms')
         if isinstance(position_ms, int):
             sp.seek_track(position_ms)
-            time.sleep(0.2)
+            await_playback_command(sp, lambda t: bool(t) and abs(t.get('progress_ms', 0) - position_ms) < 2000)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Invalid position'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/toggle-player-mode', methods=['POST'])
+@host_only
 def toggle_player_mode():
     try:
         data = request.get_json()
-        session['player_mode'] = data.get('playerMode', False)
+        set_quiz_setting('player_mode', data.get('playerMode', False))
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route("/solve")
 def solve():
-    if 'quiz_state' in session:
-        quiz_state = session['quiz_state']
-        quiz_state['is_solved'] = True
-        session['quiz_state'] = quiz_state
-    return redirect(url_for('home'))
+    quiz_state = get_quiz_setting('quiz_state')
+    if quiz_state is not None:
+        # Erst werten, dann auflösen: die anderen Bildschirme laden danach die neue Bestenliste.
+        # Auch bei schon aufgelöster Runde, falls die Wertung beim letzten Mal ausfallen musste.
+        sp = get_spotify_client()
+        try:
+            if sp:
+                score_current_round(sp, quiz_state)
+        except Exception as e:
+            print(f"Fehler beim Werten der Tipps: {e}")
+        if not quiz_state.get('is_solved'):
+            set_quiz_setting('quiz_state', dict(quiz_state, is_solved=True))
+    return respond_with_state()
+
+@app.route('/guess', methods=['POST'])
+def guess():
+    """Tipp für die laufende Runde: Jahr, Interpret und Titel, gewertet beim Auflösen."""
+    if not leaderboard.available():
+        return jsonify({'success': False, 'error': 'Tipps brauchen Redis'}), 503
+    data = request.get_json(silent=True) or {}
+    quiz_state = get_quiz_setting('quiz_state') or {}
+    if not quiz_state or data.get('track_id') != quiz_state.get('track_id'):
+        return jsonify({'success': False, 'error': 'Die Runde ist schon vorbei'}), 409
+    if quiz_state.get('is_solved') or get_quiz_setting('player_mode', False):
+        return jsonify({'success': False, 'error': 'Die Lösung ist schon zu sehen'}), 409
+    try:
+        year = int(data['year']) if data.get('year') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Ungültiges Jahr'}), 400
+
+    name = str(data.get('name') or session.get('player_name') or '').strip()[:30] or f"Spieler {player_id()[:4]}"
+    session['player_name'] = name
+    entry = {'year': year, 'artist': str(data.get('artist') or '')[:100], 'title': str(data.get('title') or '')[:100]}
+    try:
+        leaderboard.submit(score_scope(), quiz_state.get('round_id') or quiz_state['track_id'], player_id(), name, entry)
+    except redis.RedisError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    return jsonify({'success': True})
+
+@app.route("/leaderboard")
+def leaderboard_route():
+    """Bestenliste des Raums bzw. Kontos als JSON."""
+    board = leaderboard_info()
+    if board is None:
+        return jsonify({'error': 'Keine Bestenliste verfügbar'}), 503
+    return jsonify(board)
 
 @app.route("/play_pause")
+@host_only
 def play_pause():
     sp = get_spotify_client()
     if not sp:
         return redirect(url_for('home'))
     try:
-        current_track = sp.currently_playing()
+        current_track = get_current_playback(sp)
         if current_track and current_track.get('is_playing'):
             sp.pause_playback()
             print("Playback paused.")
+            await_playback_command(sp, lambda t: not (t and t.get('is_playing')))
+        elif current_track is None and device_registry.candidates(get_spotify_user_id(sp)):
+            # Ohne Wiedergabestatus ist kein Gerät aktiv: gleich das bekannte Gerät übernehmen
+            resume_on_device(sp)
         else:
             sp.start_playback()
             print("Playback started.")
+            await_playback_command(sp, lambda t: bool(t and t.get('is_playing')))
     except spotipy.exceptions.SpotifyException as e:
         if "No active device found" in str(e) or "Player command failed" in str(e):
-            print("No active device found. Searching for an available one.")
+            print("No active device found. Activating a known device.")
             try:
-                # KORREKTUR: Wir holen die Liste mit .get('devices', []) sicher aus dem Container-Objekt.
-                device_list = sp.devices().get('devices', [])
-                if device_list:
-                    # DEINE PRIORITÄTENLISTE
-                    priorities = {'Smartphone': 1, 'Computer': 2, 'Speaker': 3}
-
-                    # Wir sortieren nun die device_list, was eine echte Liste von Geräten ist.
-                    sorted_devices = sorted(device_list, key=lambda d: priorities.get(d['type'], 99))
-                    
-                    # --- FÜGE DIESEN DEBUG-BLOCK EIN ---
-                    print("--- Sortierte Geräteliste (Priorität: Smartphone > Computer > Speaker) ---")
-                    for i, device in enumerate(sorted_devices):
-                        print(f"  {i+1}. Name: {device.get('name', 'N/A')}, Typ: {device.get('type', 'N/A')}")
-                    print("--------------------------------------------------------------------")
-                    # --- ENDE DEBUG-BLOCK ---
-
-
-                    best_device = sorted_devices[0]
-                    best_device_id = best_device['id']
-                    print(f"No active device. Activating best-choice device: {best_device['name']} ({best_device['type']})")
-                    sp.start_playback(device_id=best_device_id)
-                else:
-                    print("No available devices found for user.")
+                resume_on_device(sp)
             except Exception as device_error:
                 print(f"Error while trying to activate a device: {device_error}")
         else:
             print(f"An unexpected Spotify API error occurred: {e}")
     except Exception as e:
         print(f"A general error occurred in play_pause: {e}")
-    
-    time.sleep(0.5)
-    return redirect(url_for('home'))
+
+    return respond_after_command()
 
 @app.route("/next")
+@host_only
 def next_track():
     sp = get_spotify_client()
     if not sp: return redirect(url_for('home'))
     try:
+        previous_track_id = get_quiz_setting('quiz_state', {}).get('track_id')
         sp.next_track()
-        session.pop('quiz_state', None)
-        time.sleep(0.5)
-    except Exception:
-        pass
-    return redirect(url_for('home'))
+        set_quiz_setting('quiz_state', None, notify=False)
+        await_playback_command(sp, lambda t: playing_track_id(t) != previous_track_id)
+    except Exception as e:
+        print(f"Fehler bei /next: {e}")
+    return respond_after_command()
 
 @app.route("/previous")
+@host_only
 def previous_track():
     sp = get_spotify_client()
     if not sp: return redirect(url_for('home'))
     try:
+        previous_track_id = get_quiz_setting('quiz_state', {}).get('track_id')
         sp.previous_track()
-        session.pop('quiz_state', None)
-        time.sleep(0.5)
-    except Exception:
-        pass
-    return redirect(url_for('home'))
+        set_quiz_setting('quiz_state', None, notify=False)
+        # Beim ersten Titel springt Spotify nur an den Anfang zurück
+        await_playback_command(sp, lambda t: playing_track_id(t) != previous_track_id
+                               or bool(t and t.get('progress_ms', 0) < 3000))
+    except Exception as e:
+        print(f"Fehler bei /previous: {e}")
+    return respond_after_command()
 
 # NEUE ROUTE FÜR ZUFÄLLIGEN SONG AUS PLAYLIST
 @app.route("/play_random")
+@host_only
 def play_random():
     sp = get_spotify_client()
     if not sp:
         return redirect(url_for('home'))
 
-    playlist_uri = "spotify:playlist:76urfTElnBTZh1HXxDckec"
-
     try:
-        # 1. Shuffle-Modus aktivieren
-        sp.shuffle(True)
-        # 2. Wiedergabe der Playlist starten (Spotify wählt durch Shuffle einen zufälligen Startpunkt)
-        sp.start_playback(context_uri=playlist_uri)
-        # Kurze Pause, damit der neue Song geladen werden kann, bevor die Seite neu lädt
-        time.sleep(0.7)
+        previous_track_id = get_quiz_setting('quiz_state', {}).get('track_id')
+        if deck_mode:
+            # Der nächste Song steht fest: Runde gleich starten und seine Lösung vorbereiten
+            deck, position = advance_deck(sp, previous_track_id)
+            next_track_id = deck['track_ids'][position]
+            start_quiz_round(next_track_id)
+            schedule_round_enrichment(sp, next_track_id)
+        else:
+            # 1. Shuffle-Modus aktivieren
+            sp.shuffle(True)
+            # 2. Wiedergabe der Playlist starten (Spotify wählt durch Shuffle einen zufälligen Startpunkt)
+            sp.start_playback(context_uri=f"spotify:playlist:{random_playlist_id}")
+        # 3. Statt fester Pause warten, bis Spotify den neuen Song meldet
+        await_playback_command(sp, lambda t: playing_track_id(t) != previous_track_id)
     except spotipy.exceptions.SpotifyException as e:
         # Fehlerbehandlung, falls z.B. kein aktives Gerät gefunden wird
         print(f"Spotify API Fehler: {e}")
-        # Optional: Eine Fehlermeldung an den User weiterleiten
-        pass
+        # Es kommt kein neuer Zustand per /events: den aktuellen gleich zurückgeben
+        return respond_with_state()
     except Exception as e:
         print(f"Ein unerwarteter Fehler ist aufgetreten: {e}")
-        pass
+        return respond_with_state()
 
-    return redirect(url_for('home'))
+    return respond_after_command()
+
+@app.route("/cover/<album_id>")
+def cover(album_id):
+    """Album-Cover aus dem Datei-Cache, in der kleinsten Variante ab ?size= Pixeln."""
+    if not re.fullmatch(r"[0-9A-Za-z]{22}", album_id):
+        abort(404)
+    requested = request.args.get('size', cover_display_size, type=int)
+    size = next((s for s in COVER_SIZES if s >= requested), COVER_SIZES[-1])
+    sp = get_spotify_client()
+    if not sp:
+        abort(403)
+    try:
+        path = fetch_cover_file(sp, album_id, size)
+    except Exception as e:
+        print(f"Fehler beim Laden des Covers {album_id}: {e}")
+        abort(502)
+    if not path:
+        abort(404)
+    # Cover eines Albums ändern sich praktisch nie, Browser dürfen sie lange behalten
+    response = send_file(path, mimetype='image/jpeg', conditional=True, max_age=cover_browser_cache_seconds)
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/debug/slow-requests")
+@admin_only
+def slow_requests_page():
+    """Die letzten profilierten Anfragen mit ihrer Aufteilung; nur mit ?token=<ADMIN_TOKEN>."""
+    response = Response(render_template(
+        'slow_requests.html',
+        css_variables=css_variables(PALETTES['default']),
+        requests=slow_requests.recent(),
+        slow_ms=profile_slow_ms,
+        sample_rate=profile_sample_rate,
+    ))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route("/cache-stats")
+@admin_only
+def cache_stats():
+    """Trefferquoten der Caches dieses Workers als JSON."""
+    return jsonify({
+        'original_year': year_cache.stats(),
+        'album_palette': palette_cache.stats(),
+        'playlist_tracks': playlist_cache.stats(),
+        'original_version': resolver_stats.stats(),
+    })
+
+@app.route("/metrics")
+@admin_only
+def metrics_endpoint():
+    """Metriken aller Worker im Prometheus-Textformat."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/http-stats")
+@admin_only
+def http_stats():
+    """Wiederverwendung der Keep-Alive-Verbindungen und Drosselung der Spotify-Aufrufe dieses Workers als JSON."""
+    return jsonify(dict(http_pool_stats(), spotify_gateway=spotify_gateway.stats()))
 
 @app.route("/set-theme/<theme_name>")
+@host_only
 def set_theme(theme_name):
     """Speichert die vom Nutzer gewählte Farbpalette in der Session."""
     if theme_name in PALETTES:
-        session['theme'] = theme_name
+        set_quiz_setting('theme', theme_name)
+    return respond_with_state()
+
+@app.route('/theme', methods=['POST'])
+@host_only
+def save_theme():
+    """Speichert das im Browser gewählte Theme; die Farben hat die Seite schon selbst gesetzt."""
+    theme_name = (request.get_json(silent=True) or {}).get('theme')
+    if theme_name not in PALETTES:
+        return jsonify({'success': False, 'error': 'Unbekanntes Theme'}), 400
+    set_quiz_setting('theme', theme_name)
+    room = current_room()
+    # Mit der Version ignoriert der Tab das Raum-Event seiner eigenen Änderung
+    return jsonify({'success': True, 'room_version': room['version'] if room else None})
+
+@app.route("/palettes/album/<album_id>")
+def album_palette(album_id):
+    """Palette eines Album-Covers. Hängt nur am Album und darf daher lange gecacht werden."""
+    if not re.fullmatch(r"[0-9A-Za-z]{22}", album_id):
+        abort(404)
+    images = album_images(None, album_id)
+    if not images:
+        sp = get_spotify_client()
+        if not sp:
+            abort(403)
+        images = album_images(sp, album_id)
+    palette = get_album_palette(album_id, images)
+    response = jsonify(palette)
+    response.set_etag(hashlib.md5(json.dumps(palette, sort_keys=True).encode()).hexdigest()[:16])
+    response.cache_control.public = True
+    # Fehlgeschlagene Analysen (Standardpalette) nur kurz cachen
+    response.cache_control.max_age = palette_cache_negative_ttl_seconds if palette == PALETTES['default'] else 24 * 3600
+    return response.make_conditional(request)
+
+@app.route("/room/create")
+def create_room():
+    """Eröffnet einen Raum, den das eigene Spotify-Konto steuert; bisherige Einstellungen werden übernommen."""
+    token_sid = session.get(TOKEN_SID_KEY)
+    sp = get_spotify_client()
+    if not sp or not token_sid or not room_store.available():
+        return redirect(url_for('home'))
+    leave_room()
+    state = {name: session.get(name) for name in ('quiz_state', 'player_mode', 'theme')}
+    room = room_store.create(get_spotify_user_id(sp), token_sid, state)
+    session['room_code'] = room['code']
+    session['room_host'] = True
+    return redirect(url_for('home'))
+
+@app.route("/room/join")
+@app.route("/room/<code>")
+def join_room(code=None):
+    """Beitritt per Code (Formular) oder Link; Gäste brauchen kein Spotify-Login."""
+    code = (code or request.args.get('code', '')).strip().upper()
+    room = None
+    if code and room_store.available():
+        if room_join_blocked():
+            session['join_error'] = "Zu viele Versuche, bitte in einer Minute erneut probieren."
+            return redirect(url_for('home'))
+        try:
+            room = room_store.load(code)
+        except redis.RedisError as e:
+            print(f"Raum {code} nicht erreichbar: {e}")
+        if room is None:
+            record_failed_join()
+    if room is None:
+        session['join_error'] = f"Raum {code} nicht gefunden." if code else "Bitte einen Raumcode eingeben."
+        return redirect(url_for('home'))
+    leave_room()
+    session['room_code'] = room['code']
+    return redirect(url_for('home'))
+
+def leave_room():
+    """Verlässt den Raum der Session; verlässt ihn der Host, wird er für alle geschlossen."""
+    code = session.pop('room_code', None)
+    is_host = session.pop('room_host', False)
+    g.pop('room', None)
+    if code and is_host and room_store.available():
+        try:
+            room_store.close(code)
+        except redis.RedisError as e:
+            print(f"Raum {code} konnte nicht geschlossen werden: {e}")
+
+@app.route("/room/leave")
+def leave_room_route():
+    leave_room()
     return redirect(url_for('home'))
 
 
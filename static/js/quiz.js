@@ -0,0 +1,113 @@
+// Fortschrittsbalken-Animation, Live-Updates und Bedienelemente der Quiz-Seite.
+// Der Zustand pro Track steht in window.quizConfig.state (gleiches Format wie /api/state).
+document.addEventListener('DOMContentLoaded', function() {
+    const config = window.quizConfig;
+    const progressTrack = document.getElementById('progressTrack'); const progressFill = document.getElementById('progressFill'); const interactiveArea = document.querySelector('.progress-interactive-area'); const svgWidth = 300; const svgHeight = 14; const midHeight = svgHeight / 2; const amplitude = 6; const frequency = 0.05; const segments = 150; const waveSpeed = config.waveAnimationSpeed;
+    let initialTrackId = config.state.track_id; let roomVersion = config.state.room ? config.state.room.version : null; const pollingInterval = config.pollingIntervalSeconds * 1000;
+    let currentProgress = config.state.progress_ms; let totalDuration = config.state.duration_ms; let isPlaying = config.state.is_playing;
+    let animationFrameId = null; let animationStartTime = performance.now();
+    function generateWavePath(phase) { let path = `M 0 ${midHeight}`; for (let i = 0; i <= segments; i++) { const x = (i / segments) * svgWidth; const fadeWidth = svgWidth * 0.1; let currentAmplitude = amplitude; if (x < fadeWidth) { currentAmplitude = amplitude * Math.sin((x / fadeWidth) * (Math.PI / 2)); } else if (x > svgWidth - fadeWidth) { currentAmplitude = amplitude * Math.sin(((svgWidth - x) / fadeWidth) * (Math.PI / 2)); } const y = midHeight + Math.sin(x * frequency + phase) * currentAmplitude; path += ` L ${x.toFixed(3)} ${y.toFixed(3)}`; } return path; }
+    function updateProgressBar(progress) { if (totalDuration > 0) { const progressRatio = Math.min(progress / totalDuration, 1); const dynamicPhase = progressRatio * Math.PI * waveSpeed; const wavePath = generateWavePath(dynamicPhase); progressTrack.setAttribute('d', wavePath); progressFill.setAttribute('d', wavePath); const totalLength = progressFill.getTotalLength(); if (totalLength > 0) { progressFill.style.strokeDasharray = totalLength; progressFill.style.strokeDashoffset = totalLength * (1 - progressRatio); } } }
+    function animate(currentTime) { const elapsedTime = currentTime - animationStartTime; const newProgress = currentProgress + elapsedTime; updateProgressBar(newProgress); if (newProgress < totalDuration) { animationFrameId = requestAnimationFrame(animate); } }
+    function startAnimation() { if (isPlaying) { animationStartTime = performance.now(); animationFrameId = requestAnimationFrame(animate); } }
+    function stopAnimation() { if (animationFrameId) { cancelAnimationFrame(animationFrameId); animationFrameId = null; } }
+    function syncProgress(progress, duration, playing) { stopAnimation(); currentProgress = progress; totalDuration = duration; isPlaying = playing; updateProgressBar(currentProgress); startAnimation(); }
+    updateProgressBar(currentProgress); startAnimation();
+    interactiveArea.addEventListener('click', function(event) { if (totalDuration > 0 && config.canControl) { stopAnimation(); const rect = interactiveArea.getBoundingClientRect(); const clickX = event.clientX - rect.left; const clickPercentage = Math.max(0, Math.min(1, clickX / rect.width)); const seekPositionMs = Math.round(clickPercentage * totalDuration); currentProgress = seekPositionMs; updateProgressBar(currentProgress); startAnimation(); fetch('/seek', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ position_ms: seekPositionMs }) }).catch(error => console.error('Error seeking track:', error)); } });
+
+    // --- Zustand ohne Neuladen übernehmen ---
+    const themePickerToggle = document.getElementById('theme-picker-toggle');
+    const playerModeToggle = document.getElementById('playerMode');
+    function applyPalette(palette, theme) {
+        const root = document.documentElement.style;
+        root.setProperty('--highlight-color', palette.highlight_color); root.setProperty('--button-hover-color', palette.button_hover_color); root.setProperty('--button-text-color', palette.button_text_color);
+        if (themePickerToggle) { themePickerToggle.classList.toggle('album-theme-active', theme === 'album'); themePickerToggle.style.backgroundColor = theme === 'album' ? '' : palette.highlight_color; }
+    }
+    // --- Tipps und Bestenliste ---
+    const guessForm = document.getElementById('guess-form'); const guessStatus = document.getElementById('guess-status'); const leaderboardList = document.getElementById('leaderboard');
+    let guessTrackId = config.state.track_id;
+    function resetGuess() { ['year', 'artist', 'title'].forEach(name => { guessForm.elements[name].value = ''; }); guessStatus.hidden = true; }
+    function renderLeaderboard(board) { if (!leaderboardList || !board) { return; } leaderboardList.replaceChildren(...board.players.map(player => { const item = document.createElement('li'); item.className = player.is_me ? 'is-me' : ''; item.textContent = `${player.name}: ${player.score}` + (player.last_round != null ? ` (+${player.last_round})` : ''); return item; })); leaderboardList.hidden = board.players.length === 0; }
+    if (guessForm) { guessForm.addEventListener('submit', function(event) { event.preventDefault(); const fields = guessForm.elements; fetch('/guess', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ track_id: guessTrackId, year: fields.year.value, artist: fields.artist.value, title: fields.title.value, name: fields.name.value }) }).then(response => response.json()).then(data => { guessStatus.textContent = data.success ? 'Tipp gespeichert, ändern geht bis zum Auflösen.' : data.error; guessStatus.hidden = false; }).catch(error => console.error('Error:', error)); }); }
+    // --- Theme-Wechsel im Browser: Farben sofort setzen, Auswahl per POST speichern ---
+    let albumId = config.state.album_id; let selectedTheme = config.state.theme; const albumPalettes = {};
+    function loadAlbumPalette(id) {
+        if (!id) { return Promise.resolve(config.palettes.default); }
+        if (!albumPalettes[id]) { albumPalettes[id] = fetch(`/palettes/album/${id}`).then(response => response.ok ? response.json() : config.palettes.default).catch(() => config.palettes.default); }
+        return albumPalettes[id];
+    }
+    function selectTheme(theme) {
+        selectedTheme = theme;
+        const palette = theme === 'album' ? loadAlbumPalette(albumId) : Promise.resolve(config.palettes[theme]);
+        palette.then(p => { if (selectedTheme === theme) { applyPalette(p, theme); } });
+        fetch('/theme', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ theme: theme }) }).then(response => response.ok ? response.json() : Promise.reject('Failed to save theme')).then(data => { if (data.room_version != null) { roomVersion = data.room_version; } }).catch(error => console.error('Error:', error));
+    }
+    document.addEventListener('click', function(event) { const dot = event.target.closest('a[data-theme]'); if (!dot) { return; } event.preventDefault(); selectTheme(dot.dataset.theme); });
+    function applyState(state) {
+        if (!state || state.error) { window.location.reload(); return; } // Fehler- bzw. Login-Seite rendert der Server
+        albumId = state.album_id; selectedTheme = state.theme;
+        const track = state.track; const hasOriginal = !!track && track.original_release_year < track.release_year;
+        initialTrackId = state.track_id; roomVersion = state.room ? state.room.version : null;
+        document.getElementById('track-title').textContent = track ? track.name : 'Welcher Song ist das?';
+        document.getElementById('track-artists').textContent = track ? track.artists : 'Wer ist der Interpret?';
+        const albumArt = document.getElementById('album-art'); if (track && albumArt.getAttribute('src') !== track.image_url) { albumArt.srcset = track.image_srcset || ''; albumArt.src = track.image_url; } albumArt.hidden = !track;
+        document.getElementById('quiz-placeholder').hidden = !!track;
+        document.getElementById('year-question').hidden = !!track;
+        document.getElementById('info-section').hidden = !track;
+        if (track) {
+            document.getElementById('info-album').textContent = track.album_name;
+            document.getElementById('info-release-year').textContent = track.release_year;
+            document.getElementById('info-release-year-row').hidden = !hasOriginal;
+            document.getElementById('info-cleaned-name').textContent = track.cleaned_name;
+            document.getElementById('info-original-album').textContent = track.original_album_name;
+            document.getElementById('info-original').hidden = !hasOriginal;
+            document.getElementById('prominent-year').textContent = track.original_release_year;
+        }
+        if (guessForm) { guessForm.hidden = !!track; if (state.track_id !== guessTrackId) { resetGuess(); } guessTrackId = state.track_id; }
+        renderLeaderboard(state.leaderboard);
+        const mainButton = document.getElementById('main-button'); mainButton.textContent = track ? 'Nächstes Lied' : 'Auflösen'; mainButton.setAttribute('href', track ? '/next' : '/solve'); mainButton.hidden = !!track && !config.canControl; // Gäste im Raum lösen nur auf
+        if (playerModeToggle) { playerModeToggle.checked = state.player_mode; }
+        applyPalette(state.palette, state.theme);
+        syncProgress(state.progress_ms, state.duration_ms, state.is_playing);
+    }
+    function refreshState() { fetch('/api/state', { headers: { 'Accept': 'application/json' } }).then(response => response.ok ? response.json() : Promise.reject('Failed to load state')).then(applyState).catch(error => { console.error('Error loading state:', error); window.location.reload(); }); }
+
+    // --- Live-Updates (Server-Sent Events, sonst Polling) ---
+    let eventsConnected = false;
+    function handleTrackUpdate(data) { if (!data) { return; } if (data.track_id !== initialTrackId || (data.room_version != null && data.room_version !== roomVersion)) { refreshState(); } else if ('is_playing' in data && data.is_playing !== isPlaying) { syncProgress(data.progress_ms, data.duration_ms, data.is_playing); } }
+    // Polling mit ETag (304 = unverändert) und dem vom Server vorgeschlagenen Abstand
+    let pollingTimer = null; let pollingEtag = null;
+    function schedulePoll(delay) { clearTimeout(pollingTimer); pollingTimer = setTimeout(pollOnce, delay); }
+    function pollOnce() {
+        fetch('/check-song', { cache: 'no-store', headers: pollingEtag ? { 'If-None-Match': pollingEtag } : {} }).then(response => {
+            const hint = parseInt(response.headers.get('X-Next-Poll-Ms'), 10); schedulePoll(isNaN(hint) ? pollingInterval : hint);
+            if (response.status === 304) { return null; }
+            if (!response.ok) { return Promise.reject('Network response was not ok'); }
+            pollingEtag = response.headers.get('ETag'); return response.json();
+        }).then(handleTrackUpdate).catch(error => { console.error('Error during polling:', error); schedulePoll(pollingInterval); });
+    }
+    function startPolling() { if (pollingTimer) { return; } schedulePoll(pollingInterval); }
+    if (config.serverSentEvents && window.EventSource) { const trackEvents = new EventSource('/events'); trackEvents.onopen = function() { eventsConnected = true; }; trackEvents.addEventListener('track', function(event) { handleTrackUpdate(JSON.parse(event.data)); }); trackEvents.addEventListener('room', function(event) { const data = JSON.parse(event.data); if (data.closed) { window.location.reload(); } else if (data.version !== roomVersion) { refreshState(); } }); trackEvents.onerror = function() { eventsConnected = false; if (trackEvents.readyState === EventSource.CLOSED) { startPolling(); } }; } else { startPolling(); }
+
+    // --- Aktionen (Auflösen, Weiter, Theme, ...) per fetch statt Redirect ---
+    function handleActionResponse(data) { if (data.pending) { if (!eventsConnected) { setTimeout(refreshState, 1000); } return; } applyState(data); } // pending: neuer Zustand kommt per /events
+    document.addEventListener('click', function(event) {
+        const link = event.target.closest('a[data-action]'); if (!link) { return; }
+        event.preventDefault();
+        fetch(link.getAttribute('href'), { headers: { 'Accept': 'application/json' } }).then(response => response.ok ? response.json() : Promise.reject('Action failed')).then(handleActionResponse).catch(error => { console.error('Error:', error); window.location.href = link.href; });
+    });
+    if (playerModeToggle) { playerModeToggle.addEventListener('change', function() { const isEnabled = this.checked; fetch('/toggle-player-mode', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ playerMode: isEnabled }) }).then(response => response.ok ? response.json() : Promise.reject('Failed to toggle mode')).then(data => { if (data.success) { refreshState(); } }).catch(error => console.error('Error:', error)); }); }
+    const themeOptions = document.getElementById('theme-options');
+    if (themePickerToggle && themeOptions) {
+        themePickerToggle.addEventListener('click', function(event) {
+            event.stopPropagation();
+            themeOptions.classList.toggle('active');
+            if (selectedTheme !== 'album') { loadAlbumPalette(albumId); } // Vorladen, bis ein Punkt gewählt ist
+        });
+        document.addEventListener('click', function() {
+            if (themeOptions.classList.contains('active')) {
+                themeOptions.classList.remove('active');
+            }
+        });
+    }
+});